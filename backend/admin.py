@@ -1,8 +1,11 @@
 from django.contrib import admin
-from .models import Applicant, ApplicationStatus, Interviewer, InterviewScore
+from .models import Applicant, ApplicationStatus, Interviewer, InterviewScore, EmailOutbox, FailedEmail, EmailSendLog, FileBlob
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q
+from django.utils.html import format_html
+from .caching import invalidate_writing_task
+from .media import download_name, signed_url, writing_tasks_zip
+from .permissions import department_scope
 
 from unfold.admin import ModelAdmin, TabularInline
 
@@ -33,6 +36,10 @@ class ListInterviewScoreInline(TabularInline):
     verbose_name = "查看面试评分"
     verbose_name_plural = "查看面试评分"
     
+    def get_queryset(self, request):
+        # each row's title is InterviewScore.__str__, which reads the application and applicant
+        return super().get_queryset(request).select_related("application__applicant")
+    
     def has_add_permission(self, request, obj):
         return False
 
@@ -57,39 +64,22 @@ class ApplicantAdmin(ModelAdmin):
     list_filter = ('grade', 'first_choice', 'second_choice', 'src')
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-
-        if request.user.is_superuser:
-            return qs
-        query = Q()
-        depts = ("LAW", "IT", "LIA", "FIN",
-                 "PR", "HR", "CM", "TUT")
-        
-        for g in request.user.groups.all():
-            print(g.name)
-            if g.name in depts:
-                query.add(Q(first_choice=g.name), Q.OR)
-                query.add(Q(second_choice=g.name), Q.OR)
-            elif g.name == "ALL":
-                return qs
-        if len(query) == 0:
-            return qs.none()
-        return qs.filter(query)
+        return department_scope(request.user, super().get_queryset(request), "first_choice", "second_choice")
     
 class ApplicationStatusAdmin(ModelAdmin):
     search_fields = ('applicant', )
     list_display = ('applicant','status', 'interview_time', 'writiing_task_score', 'avgInterviewScore', 'totalScore', 'handle_by',)
     list_filter = ('handle_by', 'status')
-    readonly_fields = ["writing_task_file", "writing_task_video_link"]
+    readonly_fields = ["writing_task_file_link", "writing_task_video_link"]
     list_per_page = 30
     fields = ["applicant", ("status", "handle_by"), "writing_task_ddl",
-              ("writing_task_file", "writing_task_video_link"),
+              ("writing_task_file_link", "writing_task_video_link"),
               "interview_time", ("interviewer", "interview_uploaded_to_feishu"),
               ("writiing_task_score", "writing_task_comment"),
               "remark"]
     raw_id_fields = ('applicant', )
     autocomplete_fields = ('interviewer', )
-    actions = ['send_writing_task_email','check_writing_task_expired', 'send_interview_email', 'send_decision_email', ]
+    actions = ['send_writing_task_email','check_writing_task_expired', 'download_writing_tasks', 'send_interview_email', 'send_decision_email', ]
     
     inlines = [
         ListInterviewScoreInline,
@@ -97,24 +87,16 @@ class ApplicationStatusAdmin(ModelAdmin):
     ]
     
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-
-        if request.user.is_superuser:
-            return qs
-        query = Q()
-        depts = ("LAW", "IT", "LIA", "FIN",
-                 "PR", "HR", "CM", "TUT")
-        
-        for g in request.user.groups.all():
-            print(g.name)
-            if g.name in depts:
-                query.add(Q(handle_by=g.name), Q.OR)
-            elif g.name == "ALL":
-                return qs        
-        if len(query) == 0:
-            return qs.none()
-        return qs.filter(query)
+        # the writing-task file view applies the same scope
+        return department_scope(request.user, super().get_queryset(request), "handle_by")
+    
     
+    def writing_task_file_link(self, obj):
+        # a signed, expiring URL: opening it again does not query the database
+        if not obj.writing_task_file:
+            return "-"
+        return format_html('<a href="{}" target="_blank">{}</a>', signed_url(obj), download_name(obj))
+    writing_task_file_link.short_description = "笔试文件"
     
     def get_readonly_fields(self, request, obj=None):
         fields = super(ApplicationStatusAdmin, self).get_readonly_fields(request)
@@ -136,47 +118,46 @@ class ApplicationStatusAdmin(ModelAdmin):
             del actions["send_decision_email"]
         return actions
     
+    def _send_emails(self, request, queryset, kind, label):
+        # sending at the senders' rate limits takes minutes for a large batch, so the
+        # emails are queued and sent by drain_email_outbox instead of in this request
+        queued = EmailOutbox.enqueue(queryset, kind)
+        skipped = queryset.count() - queued
+        message = f"已将{queued}封{label}加入发送队列"
+        if skipped:
+            message += f", {skipped}个申请的状态不符或已在队列中, 已跳过"
+        self.message_user(request, message, level=messages.INFO if queued else messages.WARNING)
+    
     def send_writing_task_email(self, request, queryset):
-        all_success = True
-        self.message_user(request, "处理中...", level=messages.INFO)
-        for application in queryset:
-           all_success = all_success and application.send_writing_task_email()
-        if all_success:
-            self.message_user(request, "全部笔试邮件发送成功")
-        else:
-            self.message_user(request, "某些笔试邮件发送失败", level=messages.WARNING)
+        self._send_emails(request, queryset, "WRITING_TASK", "笔试邮件")
     send_writing_task_email.short_description = "向选择的申请发送笔试邮件"
     
     def check_writing_task_expired(self, request, queryset):
-        queryset.filter(status="WRTIING_TASK_EMAIL_SENT")\
-            .filter(writing_task_ddl__lt=timezone.now())\
-            .update(status="WRTIING_TASK_EXPIRED")
+        expired = queryset.filter(status="WRTIING_TASK_EMAIL_SENT")\
+            .filter(writing_task_ddl__lt=timezone.now())
+        applicant_ids = list(expired.values_list("applicant_id", flat=True))
+        # update() skips auto_now and the save signals, so bump modified_at and drop cached pages here
+        expired.update(status="WRTIING_TASK_EXPIRED", modified_at=timezone.now())
+        for applicant_id in applicant_ids:
+            invalidate_writing_task(applicant_id)
         self.message_user(request, "已检查过期", level=messages.INFO)
     check_writing_task_expired.short_description = "对选择的申请检查笔试过期"
             
     
+    def download_writing_tasks(self, request, queryset):
+        # the files are listed up front, the archive itself is written while it downloads
+        applications = list(queryset.exclude(writing_task_file="").exclude(writing_task_file=None)
+                            .select_related("applicant").order_by("handle_by", "applicant__name"))
+        return writing_tasks_zip(applications, f"笔试文件-{timezone.localdate():%Y%m%d}.zip")
+    download_writing_tasks.short_description = "下载选择的申请的笔试文件 (ZIP)"
+            
+    
     def send_interview_email(self, request, queryset):
-        all_success = True
-        self.message_user(request, "处理中...", level=messages.INFO)
-
-        for application in queryset:
-            all_success = all_success and application.send_interview_email()
-        if all_success:
-            self.message_user(request, "全部面试邮件发送成功")
-        else:
-            self.message_user(request, "某些面试邮件发送失败", level=messages.WARNING)
+        self._send_emails(request, queryset, "INTERVIEW", "面试邮件")
     send_interview_email.short_description = "向选择的申请发送面试邮件"
     
     def send_decision_email(self, request, queryset):
-        all_success = True
-        self.message_user(request, "处理中...", level=messages.INFO)
-
-        for application in queryset:
-            all_success = all_success and application.send_decision_email()
-        if all_success:
-            self.message_user(request, "全部录取邮件发送成功")
-        else:
-            self.message_user(request, "某些录取邮件发送失败", level=messages.WARNING)
+        self._send_emails(request, queryset, "DECISION", "录取邮件")
     send_decision_email.short_description = "向选择的申请发送录取/拒绝邮件"
     
     
@@ -193,9 +174,81 @@ class InterviewScoreAdmin(ModelAdmin):
     readonly_fields = ['application', 'interviewer']
     list_per_page = 30
 
+class EmailOutboxAdmin(ModelAdmin):
+    list_display = ('application', 'kind', 'state', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('state', 'kind')
+    readonly_fields = ['application', 'kind', 'attempts', 'last_error', 'claimed_at', 'next_attempt_at', 'sent_at']
+    list_select_related = ('application__applicant', )
+    list_per_page = 30
+
+    def get_queryset(self, request):
+        return department_scope(request.user, super().get_queryset(request), "application__handle_by")
+
+class FailedEmailAdmin(ModelAdmin):
+    list_display = ('application', 'kind', 'recipient', 'error_code', 'permanent', 'attempts', 'resolved', 'modified_at')
+    list_filter = ('resolved', 'kind', 'permanent')
+    readonly_fields = ['application', 'kind', 'recipient', 'error', 'error_code', 'permanent', 'attempts', 'resolved']
+    list_select_related = ('application__applicant', )
+    list_per_page = 30
+    actions = ['redrive']
+
+    def get_queryset(self, request):
+        return department_scope(request.user, super().get_queryset(request), "application__handle_by")
+    
+    def redrive(self, request, queryset):
+        unresolved = queryset.filter(resolved=False)
+        queued = 0
+        for kind in unresolved.order_by().values_list("kind", flat=True).distinct():
+            applications = ApplicationStatus.objects.filter(failed_emails__in=unresolved.filter(kind=kind))
+            queued += EmailOutbox.enqueue(applications, kind)
+        self.message_user(request, f"已将{queued}封邮件重新加入发送队列")
+    redrive.short_description = "重新发送选择的失败邮件"
+
+class EmailSendLogAdmin(ModelAdmin):
+    list_display = ('created_at', 'sender', 'template', 'result', 'duration', 'size', 'attempts', 'error_code')
+    list_filter = ('result', 'sender', 'template')
+    readonly_fields = ['recipient_hash', 'sender', 'template', 'size', 'durations', 'duration', 'attempts', 'result', 'error_code']
+    list_per_page = 30
+
+    # a log row keeps no application to scope it by, only a hash of the recipient
+    def has_module_permission(self, request):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_change_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_add_permission(self, request):
+        return False
+
+class FileBlobAdmin(ModelAdmin):
+    search_fields = ('text', 'sha256')
+    list_display = ('name', 'state', 'page_count', 'size', 'refcount', 'processed_at')
+    list_filter = ('state', )
+    readonly_fields = ['name', 'sha256', 'size', 'refcount', 'state', 'page_count', 'thumbnail', 'error', 'processed_at', 'text']
+    exclude = ['claimed_at']
+    list_per_page = 30
+
+    def get_queryset(self, request):
+        # a file is seen by the departments of the applications referencing it
+        applications = department_scope(request.user, ApplicationStatus.objects.all(), "handle_by")
+        return super().get_queryset(request).filter(name__in=applications.values("writing_task_file"))
+
+    def has_add_permission(self, request):
+        return False
+
 admin.site.register(Applicant, ApplicantAdmin)
 admin.site.register(ApplicationStatus, ApplicationStatusAdmin)
 admin.site.register(Interviewer, InterviewerAdmin)
 admin.site.register(InterviewScore, InterviewScoreAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
+admin.site.register(FailedEmail, FailedEmailAdmin)
+admin.site.register(EmailSendLog, EmailSendLogAdmin)
+admin.site.register(FileBlob, FileBlobAdmin)
 
 admin.site.disable_action('delete_selected')
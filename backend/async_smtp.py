@@ -0,0 +1,273 @@
+import asyncio
+import base64
+import re
+import smtplib
+import socket
+import ssl
+import time
+
+from . import metrics
+
+_EOL = re.compile(r"\r\n|\n|\r(?!\n)")
+_LEADING_DOT = re.compile(r"^\.", re.MULTILINE)
+
+
+def _encode_data(msg):
+    """Normalise line endings to CRLF and dot-stuff the message, as smtplib does."""
+    if isinstance(msg, bytes):
+        msg = msg.decode("utf-8")
+    data = _LEADING_DOT.sub("..", _EOL.sub("\r\n", msg))
+    if not data.endswith("\r\n"):
+        data += "\r\n"
+    return data.encode("utf-8") + b".\r\n"
+
+
+class AsyncSMTPConnection:
+    """
+    One SMTP session over asyncio streams, with STARTTLS, AUTH PLAIN and PIPELINING.
+
+    Errors are raised as the same ``smtplib`` exceptions the blocking helpers
+    see, so ``classify_smtp_error`` works for both transports.
+    """
+
+    def __init__(self, host, port, username=None, password=None, *, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.extensions = set()
+        self._reader = None
+        self._writer = None
+
+    async def connect(self):
+        with metrics.span("dns"):
+            infos = await asyncio.wait_for(asyncio.get_running_loop().getaddrinfo(
+                self.host, self.port, type=socket.SOCK_STREAM), self.timeout)
+        address = infos[0][4]
+        with metrics.span("connect"):
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(address[0], address[1]), self.timeout)
+            code, reply = await self._read_reply()
+            if code != 220:
+                self.close()
+                raise smtplib.SMTPConnectError(code, reply)
+            await self.ehlo()
+        if self.starttls:
+            if "STARTTLS" not in self.extensions:
+                raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+            with metrics.span("starttls"):
+                await self._command(b"STARTTLS", 220)
+                await self._writer.start_tls(ssl.create_default_context(), server_hostname=self.host)
+                await self.ehlo()
+        if self.username:
+            with metrics.span("auth"):
+                await self.login()
+
+    async def _read_reply(self):
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                raise smtplib.SMTPServerDisconnected(str(e)) from e
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].strip())
+            if line[3:4] != b"-":
+                try:
+                    return int(line[:3]), b"\n".join(lines)
+                except ValueError:
+                    raise smtplib.SMTPResponseException(-1, line)
+
+    def _write(self, data):
+        if self._writer is None or self._writer.is_closing():
+            raise smtplib.SMTPServerDisconnected("not connected")
+        self._writer.write(data)
+
+    async def _command(self, line, expected=250):
+        self._write(line + b"\r\n")
+        await self._writer.drain()
+        code, reply = await self._read_reply()
+        if code != expected:
+            raise smtplib.SMTPResponseException(code, reply)
+        return code, reply
+
+    async def ehlo(self):
+        _, reply = await self._command(b"EHLO saga-backend")
+        self.extensions = {line.split(b" ")[0].decode().upper() for line in reply.split(b"\n")[1:]}
+
+    async def login(self):
+        token = base64.b64encode(f"\0{self.username}\0{self.password}".encode()).decode()
+        self._write(f"AUTH PLAIN {token}\r\n".encode())
+        await self._writer.drain()
+        code, reply = await self._read_reply()
+        if code != 235:
+            raise smtplib.SMTPAuthenticationError(code, reply)
+
+    async def noop(self):
+        return (await self._command(b"NOOP"))[0]
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        """
+        Send one message; returns the refused recipients like ``smtplib.SMTP.sendmail``.
+
+        With PIPELINING, MAIL, RCPT and DATA go out in a single write, so a
+        message costs two round trips instead of four or more.
+        """
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        commands = [f"MAIL FROM:<{from_addr}>".encode()]
+        commands += [f"RCPT TO:<{to}>".encode() for to in to_addrs]
+        commands.append(b"DATA")
+
+        if "PIPELINING" in self.extensions:
+            self._write(b"".join(command + b"\r\n" for command in commands))
+            await self._writer.drain()
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            replies = []
+            for command in commands:
+                self._write(command + b"\r\n")
+                await self._writer.drain()
+                replies.append(await self._read_reply())
+                if replies[0][0] != 250:
+                    break
+
+        mail_reply, rcpt_replies = replies[0], replies[1:len(to_addrs) + 1]
+        if mail_reply[0] != 250:
+            await self._rset()
+            raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+        refused = {to: reply for to, reply in zip(to_addrs, rcpt_replies) if reply[0] not in (250, 251)}
+        if len(refused) == len(to_addrs):
+            if len(replies) > len(to_addrs) + 1 and replies[-1][0] == 354:
+                # the server accepted DATA although nobody was accepted, end the empty message
+                self._write(b".\r\n")
+                await self._writer.drain()
+                await self._read_reply()
+            await self._rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        data_reply = replies[-1]
+        if data_reply[0] != 354:
+            await self._rset()
+            raise smtplib.SMTPDataError(data_reply[0], data_reply[1])
+
+        self._write(_encode_data(msg))
+        await self._writer.drain()
+        code, reply = await self._read_reply()
+        if code != 250:
+            await self._rset()
+            raise smtplib.SMTPDataError(code, reply)
+        return refused
+
+    async def _rset(self):
+        try:
+            await self._command(b"RSET")
+        except smtplib.SMTPException:
+            pass
+
+    async def quit(self):
+        try:
+            await self._command(b"QUIT", 221)
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class AsyncSMTPConnectionPool:
+    """
+    The asyncio counterpart of ``SMTPConnectionPool``, with the same reuse,
+    NOOP health check, idle timeout and reconnect rules.
+
+    A pool belongs to the event loop it was first used on.
+    """
+
+    def __init__(self, host, port, username, password, *, max_size=4, idle_timeout=60,
+                 check_interval=10, max_messages=100, timeout=30, starttls=True, pooling=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.starttls = starttls
+        self.pooling = pooling
+
+        self._idle = []  # (connection, last_used, messages_sent), most recently used last
+        self._slots = asyncio.Semaphore(max_size)
+
+    async def _connect(self):
+        conn = AsyncSMTPConnection(self.host, self.port, self.username, self.password,
+                                   starttls=self.starttls, timeout=self.timeout)
+        try:
+            await conn.connect()
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def _checkout(self):
+        while self._idle:
+            conn, last_used, sent = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout:
+                await conn.quit()
+                continue
+            if idle_for > self.check_interval:
+                try:
+                    await conn.noop()
+                except (smtplib.SMTPException, OSError):
+                    conn.close()
+                    continue
+            return conn, sent, True
+        return await self._connect(), 0, False
+
+    async def _checkin(self, conn, sent):
+        if not self.pooling or sent >= self.max_messages:
+            await conn.quit()
+        else:
+            self._idle.append((conn, time.monotonic(), sent))
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        async with self._slots:
+            conn, sent, reused = await self._checkout()
+            try:
+                with metrics.span("data"):
+                    errs = await conn.sendmail(from_addr, to_addrs, msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                conn.close()
+                if not reused:
+                    raise
+                # the server dropped an idle connection, try once more on a new one
+                conn, sent = await self._connect(), 0
+                try:
+                    with metrics.span("data"):
+                        errs = await conn.sendmail(from_addr, to_addrs, msg)
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    conn.close()
+                    raise
+                except smtplib.SMTPException:
+                    await self._checkin(conn, sent + 1)
+                    raise
+            except smtplib.SMTPException:
+                await self._checkin(conn, sent + 1)
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            await self._checkin(conn, sent + 1)
+            return errs
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            await conn.quit()
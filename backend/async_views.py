@@ -0,0 +1,158 @@
+"""
+Async versions of the views in views.py, for deployments on asgi.py (see
+ASYNC_VIEWS in settings). They return the same JSON as the DRF views.
+
+A cached writing-task poll, the hot path, never leaves the event loop.
+Database reads go through Django's async ORM; the steps that are blocking
+by nature (transactions, multipart parsing, file storage) run in one
+``sync_to_async`` call per request.
+"""
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .caching import aget_writing_task
+from .models import Applicant, ApplicationStatus
+from .serializers import CreateApplicantSerializer, WritingTaskStatusSerializer
+from .throttling import APPLICANT_THROTTLE_CLASSES, limit_concurrency
+from .uploads import PDFUploadHandler, body_too_large
+from .views import create_applicant, delete_writing_task_file, save_writing_task_file, writing_task_response
+
+
+class ParseError(Exception):
+    pass
+
+
+def _response(data=None, status=200):
+    if data is None:
+        return HttpResponse(status=status)
+    # compact and without \u escapes, like DRF's JSONRenderer
+    return JsonResponse(data, status=status, safe=False,
+                        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")})
+
+
+def _parse_body(request):
+    """``(data, files)`` from a JSON, multipart or urlencoded body, for any method."""
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}"), {}
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {e}")
+    if request.content_type == "multipart/form-data":
+        return request.parse_file_upload(request.META, request)
+    return QueryDict(request.body, encoding=request.encoding), {}
+
+
+async def _aparse_body(request):
+    # a JSON body is decoded in place; form parsing may write uploads to disk, so it runs in a thread
+    if request.content_type == "application/json":
+        return _parse_body(request)
+    return await sync_to_async(_parse_body)(request)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@limit_concurrency("applicant_create")
+async def applicant_create(request, format=None):
+    try:
+        data, _ = await _aparse_body(request)
+    except ParseError as e:
+        return _response({"detail": str(e)}, status=400)
+    wait = max([await throttle().acheck(request, data) for throttle in APPLICANT_THROTTLE_CLASSES])
+    if wait > 0:
+        response = _response({"detail": f"Request was throttled. Expected available in {math.ceil(wait)} seconds."},
+                             status=429)
+        response["Retry-After"] = str(math.ceil(wait))
+        return response
+    serializer = CreateApplicantSerializer(data=data)
+    if not serializer.is_valid():
+        return _response(serializer.errors, status=400)
+    await sync_to_async(create_applicant)(serializer)
+    return _response(serializer.data, status=201)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "PUT"])
+async def applicant_writing_task(request, pk, format=None):
+    if request.method == "GET":
+        entry = await aget_writing_task(pk)
+        if entry is None:
+            return _response(status=404)
+        return writing_task_response(request, entry, _response)
+
+    try:
+        applicant = await Applicant.objects.aget(pk=pk)
+        data, _ = await _aparse_body(request)
+    except Applicant.DoesNotExist:
+        return _response(status=404)
+    except ParseError as e:
+        return _response({"detail": str(e)}, status=400)
+    try:
+        application = await applicant.applications.aget(handle_by=data.get("handle_by"))
+    except ApplicationStatus.DoesNotExist:
+        return _response("Can not find corresponding application", status=400)
+
+    serializer = WritingTaskStatusSerializer(application, data=data)
+    if serializer.is_valid():
+        await sync_to_async(serializer.save)()
+        return _response(status=200)
+    return _response(serializer.errors, status=400)
+
+
+@csrf_exempt
+@require_http_methods(["PUT", "DELETE"])
+async def file_detail(request, pk, format=None):
+    upload = None
+    if request.method == "PUT":
+        if body_too_large(request):
+            return _response("File size too large", status=400)
+        upload = PDFUploadHandler(request)
+        request.upload_handlers = [upload]
+
+    try:
+        applicant = await Applicant.objects.aget(pk=pk)
+    except Applicant.DoesNotExist:
+        return _response(status=404)
+
+    try:
+        data, files = await _aparse_body(request)
+    except ParseError as e:
+        return _response({"detail": str(e)}, status=400)
+    try:
+        return await _file_detail(request, applicant, upload, data, files)
+    finally:
+        # a file moved into storage is already gone, closing just drops the handle
+        for _, uploaded in files.items():
+            uploaded.close()
+
+
+async def _file_detail(request, applicant, upload, data, files):
+    if upload is not None and upload.error:
+        return _response(upload.error, status=400)
+    try:
+        application = await applicant.applications.aget(handle_by=data.get("handle_by"))
+    except ApplicationStatus.DoesNotExist:
+        return _response("Can not find corresponding application", status=400)
+
+    if (application.writing_task_ddl < timezone.now()):
+        return _response("Writing task deadline has passed", status=400)
+
+    if request.method == "PUT":
+        file = files.get("writing_task_file")
+        if file is None:
+            return _response("No file uploaded", status=400)
+        payload = data.copy()
+        payload.update(files)
+        serializer = WritingTaskStatusSerializer(application, data=payload)
+        if serializer.is_valid():
+            await sync_to_async(save_writing_task_file)(serializer, application, file)
+            return _response(file.name, status=201)
+        return _response(serializer.errors, status=400)
+
+    await sync_to_async(delete_writing_task_file)(application)
+    return _response(status=204)
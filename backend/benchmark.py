@@ -0,0 +1,21 @@
+import math
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def latency_report(latencies, elapsed, failures=0, unit="requests"):
+    """One line with throughput and latency percentiles, for the bench_* commands."""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return (
+        f"{count} {unit} in {elapsed:.2f} s, {count / elapsed if elapsed else 0:.1f} {unit}/s"
+        f"  p50 {percentile(latencies, 50) * 1000:.1f} ms"
+        f"  p95 {percentile(latencies, 95) * 1000:.1f} ms"
+        f"  p99 {percentile(latencies, 99) * 1000:.1f} ms"
+        f"  failures {failures}"
+    )
@@ -0,0 +1,77 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from .serializers import awriting_task_data, awriting_task_version, writing_task_data, writing_task_version
+
+
+def writing_task_key(pk):
+    return f"writing_task:{pk}"
+
+
+def get_writing_task(pk):
+    """
+    ``(etag, last_modified, data)`` for the writing-task page of applicant ``pk``,
+    or None if there is no such applicant.
+
+    Entries are cached until the applicant or one of its applications is saved
+    (see signals.py), or for WRITING_TASK_CACHE_TIMEOUT seconds at most. Saves
+    only clear the cache of the process they ran in, so a process-local cache
+    checks each entry against the rows' latest modified_at before serving it;
+    a shared cache (Redis, Memcached, database) is trusted without a query.
+    """
+    key = writing_task_key(pk)
+    entry = cache.get(key)
+    if entry is not None and _is_local() and writing_task_version(pk) != entry[1]:
+        entry = None
+    if entry is None:
+        entry = _writing_task_entry(pk, writing_task_data(pk))
+        if entry is not None:
+            cache.set(key, entry, getattr(settings, "WRITING_TASK_CACHE_TIMEOUT", 60))
+    return entry
+
+
+async def aget_writing_task(pk):
+    """
+    ``get_writing_task`` for async views.
+
+    The local-memory cache does no I/O, so it is used directly from the event
+    loop; Django's ``aget``/``aset`` would run it in a thread on every hit.
+    """
+    key = writing_task_key(pk)
+    local = _is_local()
+    entry = cache.get(key) if local else await cache.aget(key)
+    if entry is not None and local and await awriting_task_version(pk) != entry[1]:
+        entry = None
+    if entry is None:
+        entry = _writing_task_entry(pk, await awriting_task_data(pk))
+        if entry is not None:
+            timeout = getattr(settings, "WRITING_TASK_CACHE_TIMEOUT", 60)
+            if local:
+                cache.set(key, entry, timeout)
+            else:
+                await cache.aset(key, entry, timeout)
+    return entry
+
+
+def _is_local():
+    # a LocMemCache lives in one process, so other processes' saves never clear it
+    return isinstance(caches["default"], LocMemCache)
+
+
+def _writing_task_entry(pk, result):
+    if result is None:
+        return None
+    data, last_modified = result
+    etag = '"%s"' % hashlib.md5(f"{pk}:{last_modified.isoformat()}".encode()).hexdigest()
+    return etag, last_modified, data
+
+
+def invalidate_writing_task(applicant_id):
+    key = writing_task_key(applicant_id)
+    cache.delete(key)
+    # a request that read the rows before the change was committed may have cached them again
+    transaction.on_commit(lambda: cache.delete(key))
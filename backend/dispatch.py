@@ -0,0 +1,48 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch(items, func, max_workers):
+    """
+    Call ``func(item)`` for every item using at most ``max_workers`` threads.
+
+    ``items`` is consumed lazily, with no more than ``2 * max_workers`` items in
+    flight, so a streamed queryset is never fully loaded into memory. Each call
+    is independent: a call that returns a falsy value or raises counts as a
+    failure and does not stop the others. Returns ``(succeeded, failed)``.
+    """
+    counts = {True: 0, False: 0}
+    lock = threading.Lock()
+
+    def run(item):
+        try:
+            ok = bool(func(item))
+        except Exception:
+            logger.exception("dispatching %r failed", item)
+            ok = False
+        finally:
+            if max_workers > 1:
+                connections.close_all()
+        with lock:
+            counts[ok] += 1
+
+    if max_workers <= 1:
+        for item in items:
+            run(item)
+        return counts[True], counts[False]
+
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+    def release(future):
+        in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="email-dispatch") as executor:
+        for item in items:
+            in_flight.acquire()
+            executor.submit(run, item).add_done_callback(release)
+    return counts[True], counts[False]
@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import pdf
+from .models import ApplicationStatus, FileBlob
+
+# a worker that has parsed this many files is replaced, so a parser leaking memory cannot grow for ever
+MAX_TASKS_PER_WORKER = 50
+
+
+def pdf_executor(workers):
+    """The process pool the PDFs are parsed in; at most ``workers`` files are parsed at once."""
+    return ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=MAX_TASKS_PER_WORKER)
+
+
+def claim_blobs(batch_size, lease_seconds=600):
+    """
+    Mark up to ``batch_size`` stored files waiting to be processed as PROCESSING and return them.
+
+    Like outbox.claim_batch: SKIP LOCKED lets several workers share the queue,
+    and files claimed by a worker that died are picked up after ``lease_seconds``.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            FileBlob.objects.select_for_update(skip_locked=True)
+            .filter(Q(state="PENDING") | Q(state="PROCESSING", claimed_at__lt=now - timedelta(seconds=lease_seconds)))
+            .order_by("created_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        FileBlob.objects.filter(id__in=ids).update(state="PROCESSING", claimed_at=now)
+    return list(FileBlob.objects.filter(id__in=ids))
+
+
+def process_batch(executor, batch_size=20, lease_seconds=600):
+    """Parse one batch of files in ``executor`` and record the results; returns a ``{state: count}`` summary."""
+    storage = ApplicationStatus._meta.get_field("writing_task_file").storage
+    blobs = claim_blobs(batch_size, lease_seconds)
+    futures = [(blob, executor.submit(pdf.analyse, storage.path(blob.name))) for blob in blobs]
+    summary = {}
+    for blob, future in futures:
+        try:
+            result, error = future.result(), None
+        except Exception as e:
+            result, error = None, str(e) or type(e).__name__
+        state = record(storage, blob, result, error)
+        summary[state] = summary.get(state, 0) + 1
+    return summary
+
+
+def record(storage, blob, result, error):
+    fields = {"processed_at": timezone.now(), "error": error}
+    if result is None:
+        fields["state"] = "FAILED"
+    else:
+        fields.update(state="DONE", page_count=result["pages"], text=result["text"])
+        if result["thumbnail"]:
+            fields["thumbnail"] = storage.save_thumbnail(blob.name, result["thumbnail"])
+    # only if still claimed: the file may have been deleted, or requeued, meanwhile
+    FileBlob.objects.filter(pk=blob.pk, state="PROCESSING").update(**fields)
+    return fields["state"]
+
+
+def requeue(failed_only=False):
+    """Queue stored files for processing again, e.g. after installing a better PDF library."""
+    blobs = FileBlob.objects.filter(state="FAILED") if failed_only else FileBlob.objects.exclude(state="PENDING")
+    return blobs.update(state="PENDING", claimed_at=None)
@@ -0,0 +1,155 @@
+import re
+from html.parser import HTMLParser
+
+# Wrappers added by mail clients (Outlook.com, Apple Mail) that never appear in
+# our own markup; rules targeting them are always kept
+CLIENT_SELECTORS = ("ExternalClass", "MessageViewBody", "apple-link")
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_STYLE_BLOCK = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.S | re.I)
+_PSEUDO = re.compile(r"::?[\w-]+(\([^)]*\))?")
+_COMBINATOR = re.compile(r"\s*[>+~]\s*|\s+")
+_BLOCK_TAG = re.compile(
+    r"\s*(</?(?:html|head|body|meta|title|style|table|tbody|tr|td|div|p|ul|ol|li|hr|br)\b[^>]*>)\s*", re.I)
+
+
+class _UsageCollector(HTMLParser):
+    """Collects the tag names, classes and ids used by a document."""
+
+    def __init__(self):
+        super().__init__()
+        self.tags, self.classes, self.ids = set(), set(), set()
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag)
+        for name, value in attrs:
+            if name == "class" and value:
+                self.classes.update(value.split())
+            elif name == "id" and value:
+                self.ids.add(value)
+
+
+def _parse_rules(css):
+    """Split a stylesheet into ``(prelude, body)`` pairs; @-blocks get a list of nested rules as body."""
+    rules, i = [], 0
+    while True:
+        start = css.find("{", i)
+        if start < 0:
+            return rules
+        depth, end = 1, start + 1
+        while depth and end < len(css):
+            depth += {"{": 1, "}": -1}.get(css[end], 0)
+            end += 1
+        prelude, body = css[i:start].strip(), css[start + 1:end - 1]
+        rules.append((prelude, _parse_rules(body) if prelude.startswith("@") else body))
+        i = end
+
+
+def _selector_used(selector, usage):
+    if any(marker in selector for marker in CLIENT_SELECTORS):
+        return True
+    for compound in _COMBINATOR.split(_PSEUDO.sub("", selector).strip()):
+        tag = re.match(r"[a-zA-Z][\w-]*", compound)
+        if tag and tag.group(0).lower() not in usage.tags:
+            return False
+        if not set(re.findall(r"\.([\w-]+)", compound)) <= usage.classes:
+            return False
+        if not set(re.findall(r"#([\w-]+)", compound)) <= usage.ids:
+            return False
+    return True
+
+
+def _minify_declarations(body):
+    declarations = []
+    for declaration in body.split(";"):
+        name, _, value = declaration.partition(":")
+        if value.strip():
+            declarations.append(f"{name.strip()}:{' '.join(value.split())}")
+    return ";".join(declarations)
+
+
+def _serialize(rules, usage):
+    out = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            inner = _serialize(body, usage)
+            if inner:
+                out.append(f"{' '.join(prelude.split())}{{{inner}}}")
+            continue
+        selectors = [" ".join(s.split()) for s in prelude.split(",") if _selector_used(s, usage)]
+        declarations = _minify_declarations(body)
+        if selectors and declarations:
+            out.append(f"{','.join(selectors)}{{{declarations}}}")
+    return "".join(out)
+
+
+def prune_css(css, usage):
+    """Drop the rules whose selectors match nothing in the document and minify the rest."""
+    return _serialize(_parse_rules(_CSS_COMMENT.sub("", css)), usage)
+
+
+def optimize_html(source):
+    """
+    Shrink an email template: keep only the CSS rules the markup uses, minify
+    the stylesheet, drop comments and collapse whitespace around block tags.
+
+    ``{{ field }}`` placeholders are plain text to this pass and survive as is.
+    """
+    usage = _UsageCollector()
+    usage.feed(_STYLE_BLOCK.sub(r"\1\3", source))
+    source = _STYLE_BLOCK.sub(lambda m: m.group(1) + prune_css(m.group(2), usage) + m.group(3), source)
+    source = _HTML_COMMENT.sub("", source)
+    source = re.sub(r"\s+", " ", source)
+    return _BLOCK_TAG.sub(r"\1", source).strip()
+
+
+class _TextExtractor(HTMLParser):
+    SKIP = {"head", "style", "title", "script"}
+    BLOCK = {"p", "div", "table", "tr", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6", "body"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+        self._links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag == "br":
+            self.parts.append("\n")
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag == "hr":
+            self.parts.append("\n\n----------\n\n")
+        elif tag in self.BLOCK:
+            self.parts.append("\n\n")
+        elif tag == "a":
+            self._links.append((dict(attrs).get("href"), len(self.parts)))
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip -= 1
+        elif tag in self.BLOCK:
+            self.parts.append("\n\n")
+        elif tag == "a" and self._links:
+            href, start = self._links.pop()
+            if href and href not in "".join(self.parts[start:]):
+                self.parts.append(f" ({href})")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(re.sub(r"\s+", " ", data.replace("\xa0", " ")))
+
+    def text(self):
+        lines = (line.strip() for line in "".join(self.parts).split("\n"))
+        return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def html_to_text(source):
+    """A readable text/plain version of an email, with links written out after their text."""
+    extractor = _TextExtractor()
+    extractor.feed(source)
+    extractor.close()
+    return extractor.text()
@@ -0,0 +1,110 @@
+import functools
+import html
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .email_optimize import html_to_text, optimize_html
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates" / "emails"
+
+_PLACEHOLDER = re.compile(r"{{\s*(\w+)\s*}}")
+
+
+class CompiledTemplate:
+    """
+    An email template split once into static segments and ``{{ field }}`` slots.
+
+    Rendering only escapes the personalised values and joins them with the
+    prebuilt segments, so the HTML shell and CSS are never re-parsed or
+    re-formatted per message.
+    """
+
+    def __init__(self, segments, fields, escape=html.escape):
+        self.segments = tuple(segments)
+        self.fields = tuple(fields)
+        self.escape = escape
+
+    @classmethod
+    def compile(cls, source, escape=html.escape):
+        parts = _PLACEHOLDER.split(source)
+        return cls(parts[0::2], parts[1::2], escape)
+
+    def bind(self, **values):
+        """Return a template with ``values`` filled in and merged into the static segments."""
+        segments, fields = [self.segments[0]], []
+        for field, segment in zip(self.fields, self.segments[1:]):
+            if field in values:
+                segments[-1] += self.escape(str(values[field])) + segment
+            else:
+                fields.append(field)
+                segments.append(segment)
+        return CompiledTemplate(segments, fields, self.escape)
+
+    def render(self, **context):
+        parts = [self.segments[0]]
+        for field, segment in zip(self.fields, self.segments[1:]):
+            parts.append(self.escape(str(context[field])))
+            parts.append(segment)
+        return "".join(parts)
+
+
+class RenderedEmail(str):
+    """The HTML body of an email, carrying its plain-text alternative in ``text``."""
+
+    text = None
+    template = None
+    render_time = None
+
+
+class EmailTemplate:
+    """A compiled HTML template together with the text/plain version derived from it."""
+
+    def __init__(self, html_template, text_template, name=None):
+        self.html = html_template
+        self.text = text_template
+        self.name = name
+
+    def bind(self, **values):
+        return EmailTemplate(self.html.bind(**values), self.text.bind(**values), self.name)
+
+    def render(self, **context):
+        start = time.perf_counter()
+        content = RenderedEmail(self.html.render(**context))
+        content.text = self.text.render(**context)
+        content.template = self.name
+        content.render_time = time.perf_counter() - start
+        metrics.observe("render", content.render_time, template=self.name)
+        return content
+
+
+def read_template(name):
+    return (TEMPLATE_DIR / f"{name}.html").read_text(encoding="utf-8")
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(name):
+    """
+    Read and compile ``templates/emails/<name>.html`` on first use.
+
+    Unless ``EMAIL_TEMPLATE_OPTIMIZE`` is off, the HTML is shrunk with
+    ``optimize_html`` first; the text part is always built from the original.
+    """
+    source = read_template(name)
+    optimized = optimize_html(source) if getattr(settings, "EMAIL_TEMPLATE_OPTIMIZE", True) else source
+    return EmailTemplate(CompiledTemplate.compile(optimized),
+                         CompiledTemplate.compile(html_to_text(source), escape=str), name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(name, **static_values):
+    """
+    The ``name`` template with ``static_values`` already spliced in.
+
+    Callers pass the per-department fields here, so each (template, department)
+    pair is bound once per process.
+    """
+    return load_template(name).bind(**static_values)
@@ -0,0 +1,151 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import include, path
+
+from backend import async_views, views
+from backend.benchmark import latency_report
+from backend.models import Applicant, ApplicationStatus
+from backend.urls import build_urlpatterns
+
+BENCH_SRC = "bench_asgi"
+
+
+def urlconf(api):
+    module = ModuleType(f"bench_asgi_{api.__name__}")
+    module.urlpatterns = [path("api/v1/", include(build_urlpatterns(api)))]
+    return module
+
+
+class Command(BaseCommand):
+    help = ("Drive the writing-task GET through Django's WSGI handler (sync views, one thread per "
+            "in-flight request) and ASGI handler (async views, one event loop) and compare throughput "
+            "and tail latency")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--applicants", type=int, default=200)
+        parser.add_argument("--no-cache", action="store_true", help="bypass the response cache so every request queries")
+        parser.add_argument("--conditional", action="store_true", help="send If-None-Match so cached polls get a 304")
+
+    def handle(self, *args, **options):
+        applicants = Applicant.objects.bulk_create([
+            Applicant(name=f"申请人{i}", email=f"a{i}@example.com", phone="13800000000", school="bench",
+                      major="bench", grade="UG1", wechat="bench", first_choice="IT",
+                      self_intro="bench", disposable_time=1, src=BENCH_SRC)
+            for i in range(options["applicants"])
+        ])
+        ApplicationStatus.objects.bulk_create([
+            ApplicationStatus(applicant=applicant, handle_by="IT", status="WRTIING_TASK_EMAIL_SENT")
+            for applicant in applicants
+        ])
+        paths = [f"/api/v1/applicants/writing-tasks/{applicant.id}" for applicant in applicants]
+        paths = [paths[i % len(paths)] for i in range(options["requests"])]
+
+        overrides = dict(DEBUG=False, ALLOWED_HOSTS=["localhost"])
+        if options["no_cache"]:
+            overrides["CACHES"] = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        etags = {}
+        try:
+            with override_settings(ROOT_URLCONF=urlconf(views), **overrides):
+                if options["conditional"]:
+                    handler = WSGIHandler()
+                    etags = {p: self.wsgi_request(handler, p, None)[1] for p in set(paths)}
+                results, elapsed = self.run_wsgi(paths, etags, options["concurrency"])
+                self.report("wsgi", results, elapsed)
+            with override_settings(ROOT_URLCONF=urlconf(async_views), **overrides):
+                results, elapsed = asyncio.run(self.run_asgi(paths, etags, options["concurrency"]))
+                self.report("asgi", results, elapsed)
+        finally:
+            Applicant.objects.filter(src=BENCH_SRC).delete()
+
+    def report(self, label, results, elapsed):
+        failures = sum(1 for _, status in results if status not in (200, 304))
+        self.stdout.write(f"{label}: {latency_report([latency for latency, _ in results], elapsed, failures)}")
+
+    def wsgi_request(self, handler, path, etag):
+        environ = {
+            "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": "",
+            "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": "localhost", "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+            "wsgi.url_scheme": "http", "wsgi.version": (1, 0),
+            "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+        }
+        if etag:
+            environ["HTTP_IF_NONE_MATCH"] = etag
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split()[0])
+            started["etag"] = dict(headers).get("ETag")
+
+        response = handler(environ, start_response)
+        try:
+            b"".join(response)
+        finally:
+            response.close()
+        return started["status"], started["etag"]
+
+    def run_wsgi(self, paths, etags, concurrency):
+        handler = WSGIHandler()
+
+        def timed(path):
+            start = time.perf_counter()
+            status, _ = self.wsgi_request(handler, path, etags.get(path))
+            return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, paths))
+        return results, time.perf_counter() - start
+
+    async def run_asgi(self, paths, etags, concurrency):
+        handler = ASGIHandler()
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def timed(path):
+            headers = [(b"host", b"localhost")]
+            if etags.get(path):
+                headers.append((b"if-none-match", etags[path].encode()))
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+                "headers": headers, "server": ("localhost", 80), "client": ("127.0.0.1", 50000),
+            }
+            body_sent = False
+            disconnected = asyncio.Event()
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            status = None
+
+            async def send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+
+            async with in_flight:
+                start = time.perf_counter()
+                await handler(scope, receive, send)
+                elapsed = time.perf_counter() - start
+            disconnected.set()
+            return elapsed, status
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[timed(path) for path in paths])
+        return results, time.perf_counter() - start
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from backend.benchmark import latency_report
+from backend.email import (aclose_smtp_pools, asend_email_with_no_reply, asend_interview_email_with_support,
+                           asend_offer_email_with_hr, asend_reject_email_with_hr, close_smtp_pools,
+                           code_to_dept, compose_accept_email, compose_interview_email, compose_reject_email,
+                           compose_writing_task_email, send_email_with_no_reply, send_interview_email_with_support,
+                           recipient_hash, send_offer_email_with_hr, send_reject_email_with_hr)
+from backend.models import Applicant, ApplicationStatus, EmailSendLog, Interviewer
+from backend.smtp_sink import SMTPSink
+
+BENCH_SRC = "bench_email"
+
+
+class Command(BaseCommand):
+    help = ("Load-test the email pipeline against the local SMTP sink and report throughput, "
+            "latency percentiles and failures")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--mode", choices=["helpers", "async", "models"], default="helpers",
+                            help="helpers: compose_* + send_*; async: compose_* + asend_*; "
+                                 "models: ApplicationStatus.send_*_email on seeded applications")
+        parser.add_argument("--latency", type=float, default=0.05, help="sink delay per message, in seconds")
+        parser.add_argument("--handshake-latency", type=float, default=0.05, help="sink delay on connect and AUTH")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="share of messages answered with 451")
+        parser.add_argument("--permanent-error-rate", type=float, default=0.0, help="share of recipients refused with 550")
+        parser.add_argument("--drop-rate", type=float, default=0.0, help="share of messages whose connection is dropped")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--rate-limit", action="store_true", help="keep EMAIL_RATE_LIMITS instead of disabling them")
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(handshake_latency=options["handshake_latency"], latency=options["latency"],
+                        error_rate=options["error_rate"], permanent_error_rate=options["permanent_error_rate"],
+                        drop_rate=options["drop_rate"], seed=options["seed"])
+        overrides = dict(EMAIL_SMTP_HOST=sink.host, EMAIL_SMTP_STARTTLS=False,
+                         EMAIL_SMTP_POOL={"MAX_SIZE": options["concurrency"]})
+        if not options["rate_limit"]:
+            overrides["EMAIL_RATE_LIMITS"] = {}
+
+        with sink:
+            with override_settings(EMAIL_SMTP_PORT=sink.port, **overrides):
+                close_smtp_pools()
+                try:
+                    if options["mode"] == "async":
+                        results, elapsed = asyncio.run(self.run_async(options["messages"], options["concurrency"]))
+                    elif options["mode"] == "models":
+                        results, elapsed = self.run_models(options["messages"], options["concurrency"])
+                    else:
+                        results, elapsed = self.run_threads(self.helper_jobs(options["messages"]), options["concurrency"])
+                finally:
+                    close_smtp_pools()
+                    self.delete_send_logs(options["messages"])
+
+        latencies = [latency for latency, _ in results]
+        failures = sum(1 for _, ok in results if not ok)
+        self.stdout.write(latency_report(latencies, elapsed, failures, unit="messages"))
+        self.stdout.write(f"sink: {len(sink.messages)} accepted, {sink.rejected} rejected, "
+                          f"{sink.dropped} dropped, {sink.connections} connections")
+
+    def delete_send_logs(self, count):
+        """Every mode sends to a<i>@example.com, and every send writes an EmailSendLog row; remove them again."""
+        hashes = [recipient_hash(f"a{i}@example.com") for i in range(count)]
+        for start in range(0, len(hashes), 500):
+            EmailSendLog.objects.filter(recipient_hash__in=hashes[start:start + 500]).delete()
+
+    def helper_jobs(self, count):
+        depts = list(code_to_dept)
+        now = timezone.localtime()
+        kinds = [
+            lambda i, dept: send_email_with_no_reply(f"a{i}@example.com", "", compose_writing_task_email(i, f"申请人{i}", dept, now)),
+            lambda i, dept: send_interview_email_with_support(f"a{i}@example.com", "", compose_interview_email(
+                i, f"申请人{i}", dept, now, "https://meeting.tencent.com/dm/example")),
+            lambda i, dept: send_offer_email_with_hr(f"a{i}@example.com", "", compose_accept_email(i, f"申请人{i}", dept, now)),
+            lambda i, dept: send_reject_email_with_hr(f"a{i}@example.com", "", compose_reject_email(i, f"申请人{i}", dept)),
+        ]
+        return [lambda i=i: kinds[i % len(kinds)](i, depts[i % len(depts)]) for i in range(count)]
+
+    def run_threads(self, jobs, concurrency):
+        def timed(job):
+            start = time.perf_counter()
+            try:
+                ok = bool(job())
+            except Exception:
+                ok = False
+            finally:
+                connections.close_all()
+            return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, jobs))
+        return results, time.perf_counter() - start
+
+    async def run_async(self, count, concurrency):
+        depts = list(code_to_dept)
+        now = timezone.localtime()
+        kinds = [
+            lambda i, dept: asend_email_with_no_reply(f"a{i}@example.com", "", compose_writing_task_email(i, f"申请人{i}", dept, now)),
+            lambda i, dept: asend_interview_email_with_support(f"a{i}@example.com", "", compose_interview_email(
+                i, f"申请人{i}", dept, now, "https://meeting.tencent.com/dm/example")),
+            lambda i, dept: asend_offer_email_with_hr(f"a{i}@example.com", "", compose_accept_email(i, f"申请人{i}", dept, now)),
+            lambda i, dept: asend_reject_email_with_hr(f"a{i}@example.com", "", compose_reject_email(i, f"申请人{i}", dept)),
+        ]
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def timed(i):
+            async with in_flight:
+                start = time.perf_counter()
+                try:
+                    ok = await kinds[i % len(kinds)](i, depts[i % len(depts)])
+                except Exception:
+                    ok = False
+                return time.perf_counter() - start, ok
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[timed(i) for i in range(count)])
+        elapsed = time.perf_counter() - start
+        await aclose_smtp_pools()
+        return results, elapsed
+
+    def run_models(self, count, concurrency):
+        """Seed applications in every sendable state, send their emails, then delete them again."""
+        interviewer = Interviewer.objects.create(name="bench", department="IT", meeting_link="https://meeting.tencent.com/dm/example")
+        try:
+            statuses = ["NEW_APPLICATION", "INTERVIEW_PENDING", "INTERNAL_ACCEPTED", "INTERNAL_REJECTED"]
+            depts = list(code_to_dept)
+            applicants = Applicant.objects.bulk_create([
+                Applicant(name=f"申请人{i}", email=f"a{i}@example.com", phone="13800000000", school="bench",
+                          major="bench", grade="UG1", wechat="bench", first_choice=depts[i % len(depts)],
+                          self_intro="bench", disposable_time=1, src=BENCH_SRC)
+                for i in range(count)
+            ])
+            ApplicationStatus.objects.bulk_create([
+                ApplicationStatus(applicant=applicant, handle_by=applicant.first_choice, status=statuses[i % len(statuses)],
+                                  interviewer=interviewer, interview_time=timezone.now() + timedelta(days=1))
+                for i, applicant in enumerate(applicants)
+            ])
+            methods = {
+                "NEW_APPLICATION": ApplicationStatus.send_writing_task_email,
+                "INTERVIEW_PENDING": ApplicationStatus.send_interview_email,
+                "INTERNAL_ACCEPTED": ApplicationStatus.send_decision_email,
+                "INTERNAL_REJECTED": ApplicationStatus.send_decision_email,
+            }
+            applications = ApplicationStatus.objects.filter(applicant__src=BENCH_SRC).select_related("applicant", "interviewer")
+            jobs = [lambda application=application: methods[application.status](application) for application in applications]
+            return self.run_threads(jobs, concurrency)
+        finally:
+            Applicant.objects.filter(src=BENCH_SRC).delete()
+            interviewer.delete()
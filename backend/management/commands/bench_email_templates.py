@@ -0,0 +1,50 @@
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.email import (code_to_dept, compose_accept_email, compose_interview_email,
+                           compose_reject_email, compose_writing_task_email)
+
+
+class Command(BaseCommand):
+    help = "Render every email template N times and report time and allocated bytes per email"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        depts = list(code_to_dept)
+        now = timezone.localtime()
+        composers = {
+            "writing_task": lambda i: compose_writing_task_email(uuid.uuid4(), f"申请人{i}", depts[i % len(depts)], now),
+            "interview": lambda i: compose_interview_email(uuid.uuid4(), f"申请人{i}", depts[i % len(depts)], now,
+                                                          "https://meeting.tencent.com/dm/example"),
+            "accept": lambda i: compose_accept_email(uuid.uuid4(), f"申请人{i}", depts[i % len(depts)], now),
+            "reject": lambda i: compose_reject_email(uuid.uuid4(), f"申请人{i}", depts[i % len(depts)]),
+        }
+        for name, compose in composers.items():
+            compose(0)  # load and compile outside the measurement
+
+            start = time.perf_counter()
+            for i in range(count):
+                compose(i)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            peak = 0
+            for i in range(min(count, 1000)):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                compose(i)
+                peak += tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+
+            self.stdout.write(
+                f"{name:>12}: {elapsed / count * 1e6:.1f} us/email"
+                f"  {peak / min(count, 1000):.0f} bytes allocated/email"
+                f"  ({count} renders in {elapsed:.2f} s)"
+            )
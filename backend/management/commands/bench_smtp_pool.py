@@ -0,0 +1,52 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from backend.email import close_smtp_pools, send_email_with_no_reply
+from backend.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Compare per-message send latency with and without SMTP connection pooling against a local SMTP sink"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=200)
+        parser.add_argument("--handshake-latency", type=float, default=0.02,
+                            help="seconds the sink waits on connect and on AUTH, to imitate TCP+TLS+AUTH")
+
+    def handle(self, *args, **options):
+        content = "<html><body><p>benchmark</p></body></html>"
+        with SMTPSink(handshake_latency=options["handshake_latency"]) as sink:
+            results = {}
+            for pooling in (False, True):
+                with override_settings(EMAIL_SMTP_HOST=sink.host, EMAIL_SMTP_PORT=sink.port,
+                                       EMAIL_SMTP_STARTTLS=False, EMAIL_SMTP_POOL={"ENABLED": pooling},
+                                       EMAIL_RATE_LIMITS={}):
+                    close_smtp_pools()
+                    connections_before = sink.connections
+                    latencies = []
+                    failures = 0
+                    for i in range(options["messages"]):
+                        start = time.perf_counter()
+                        if not send_email_with_no_reply(f"applicant{i}@example.com", "benchmark", content):
+                            failures += 1
+                        latencies.append(time.perf_counter() - start)
+                    close_smtp_pools()
+                results[pooling] = latencies
+                self.report("pooled" if pooling else "unpooled", latencies, failures,
+                            sink.connections - connections_before)
+
+        speedup = statistics.mean(results[False]) / statistics.mean(results[True])
+        self.stdout.write(self.style.SUCCESS(f"pooling speedup: {speedup:.1f}x per message"))
+
+    def report(self, label, latencies, failures, connections):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:>9}: mean {statistics.mean(latencies) * 1000:.2f} ms"
+            f"  p50 {statistics.median(latencies) * 1000:.2f} ms"
+            f"  p95 {p95 * 1000:.2f} ms"
+            f"  connections {connections}  failures {failures}"
+        )
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import override_settings
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from backend import views
+from backend.benchmark import latency_report
+from backend.models import Applicant, ApplicationStatus
+from backend.serializers import WritingTaskSerializer
+
+BENCH_SRC = "bench_writing_task"
+
+
+@api_view(["GET"])
+def serializer_view(request, pk, format=None):
+    """The GET path before the single-query rewrite: a lookup plus a nested serializer."""
+    try:
+        applicant = Applicant.objects.get(pk=pk)
+    except Applicant.DoesNotExist:
+        return Response(status=404)
+    return Response(WritingTaskSerializer(applicant).data)
+
+
+class Command(BaseCommand):
+    help = "Compare requests/s of the writing-task GET endpoint against the old serializer path"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--applicants", type=int, default=100)
+
+    def handle(self, *args, **options):
+        statuses = ["NEW_APPLICATION", "WRTIING_TASK_EMAIL_SENT", "WRTIING_TASK_SUBMITTED", "INTERVIEW_PENDING"]
+        depts = ["IT", "LAW", "FIN", "PR"]
+        applicants = Applicant.objects.bulk_create([
+            Applicant(name=f"申请人{i}", email=f"a{i}@example.com", phone="13800000000", school="bench",
+                      major="bench", grade="UG1", wechat="bench", first_choice="IT",
+                      self_intro="bench", disposable_time=1, src=BENCH_SRC)
+            for i in range(options["applicants"])
+        ])
+        ApplicationStatus.objects.bulk_create([
+            ApplicationStatus(applicant=applicant, handle_by=dept, status=status,
+                              writing_task_file=f"writing_task/user_{applicant.id}/{dept}-task.pdf")
+            for applicant in applicants for dept, status in zip(depts, statuses)
+        ])
+        try:
+            factory = APIRequestFactory()
+            ids = [str(applicant.id) for applicant in applicants]
+            for label, view in [("serializer", serializer_view), ("current", views.applicant_writing_task)]:
+                latencies, queries = self.run(factory, view, ids, options["requests"])
+                elapsed = sum(latencies)
+                self.stdout.write(f"{label:>10}: {latency_report(latencies, elapsed)}"
+                                  f"  {queries / len(latencies):.1f} queries/request")
+        finally:
+            Applicant.objects.filter(src=BENCH_SRC).delete()
+
+    def run(self, factory, view, ids, count):
+        latencies = []
+        with override_settings(DEBUG=True):
+            reset_queries()
+            for i in range(count):
+                request = factory.get(f"/api/v1/applicants/writing-tasks/{ids[i % len(ids)]}")
+                start = time.perf_counter()
+                response = view(request, pk=ids[i % len(ids)])
+                response.render()
+                latencies.append(time.perf_counter() - start)
+            queries = len(connection.queries)
+        return latencies, queries
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from backend.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete finished upload sessions and abandoned ones, with their partial files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24, help="age of an untouched session before it is abandoned")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stale = UploadSession.objects.filter(
+            Q(state="COMPLETED") | Q(modified_at__lt=now - timedelta(hours=options["hours"]))
+            | Q(application__writing_task_ddl__lt=now))
+        count = 0
+        for session in stale.iterator():
+            session.delete_part()
+            session.delete()
+            count += 1
+        self.stdout.write(f"deleted {count} upload sessions")
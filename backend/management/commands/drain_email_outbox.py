@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.outbox import drain_batch
+
+
+class Command(BaseCommand):
+    help = "Send the emails queued in the outbox, e.g. writing task invitations for new applicants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument("--lease", type=int, default=300,
+                            help="seconds after which a batch claimed by a dead worker is sent again")
+        parser.add_argument("--retry-delay", type=float, default=60.0,
+                            help="seconds before a failed email is tried again, doubled after every attempt")
+        parser.add_argument("--concurrency", type=int, default=getattr(settings, "EMAIL_SEND_CONCURRENCY", 4),
+                            help="emails sent at the same time")
+        parser.add_argument("--loop", action="store_true", help="keep polling the outbox instead of exiting when it is empty")
+        parser.add_argument("--interval", type=float, default=5.0, help="seconds to wait between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            summary = drain_batch(options["batch_size"], options["max_attempts"], options["lease"],
+                                  options["retry_delay"], options["concurrency"])
+            if summary:
+                self.stdout.write(", ".join(f"{state}: {count}" for state, count in sorted(summary.items())))
+            elif not options["loop"]:
+                return
+            if not summary:
+                time.sleep(options["interval"])
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.metrics import Histogram
+from backend.models import EmailSendLog
+
+
+class Command(BaseCommand):
+    help = "Summarise EmailSendLog: latency histograms per send stage and a daily trend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="only look at sends from the last N days")
+        parser.add_argument("--sender")
+        parser.add_argument("--template")
+
+    def handle(self, *args, **options):
+        logs = EmailSendLog.objects.filter(created_at__gte=timezone.now() - timedelta(days=options["days"]))
+        if options["sender"]:
+            logs = logs.filter(sender=options["sender"])
+        if options["template"]:
+            logs = logs.filter(template=options["template"])
+
+        stages = defaultdict(Histogram)
+        days = defaultdict(lambda: [Histogram(), 0, 0])  # total latency, failures, bytes
+        for created_at, durations, result, size in logs.values_list(
+                "created_at", "durations", "result", "size").iterator(chunk_size=2000):
+            for stage, ms in durations.items():
+                stages[stage].observe(ms / 1000)
+            day = days[timezone.localtime(created_at).date()]
+            day[0].observe(durations.get("total", 0) / 1000)
+            day[1] += result == "FAILED"
+            day[2] += size
+
+        if not days:
+            self.stdout.write("no sends logged")
+            return
+        self.stdout.write("stages:")
+        for stage, histogram in sorted(stages.items(), key=lambda item: -item[1].sum):
+            self.stdout.write(f"  {stage:>10}: {histogram.summary()}")
+        self.stdout.write("daily:")
+        for date, (histogram, failures, size) in sorted(days.items()):
+            self.stdout.write(f"  {date}: {histogram.summary()} failed={failures} "
+                              f"avg size={size / histogram.count:.0f} bytes")
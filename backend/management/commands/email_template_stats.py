@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from backend.email import _build_message
+from backend.email_templates import TEMPLATE_DIR, CompiledTemplate, load_template, read_template
+
+
+class Command(BaseCommand):
+    help = "Report how many bytes the template optimisation saves per email template and per sent message"
+
+    def handle(self, *args, **options):
+        for path in sorted(TEMPLATE_DIR.glob("*.html")):
+            name = path.stem
+            source = read_template(name)
+            template = load_template(name)
+            context = {field: "x" for field in template.html.fields + template.text.fields}
+
+            original = CompiledTemplate.compile(source).render(**context)
+            before = len(_build_message("from@example.com", "reply@example.com", "", "to@example.com", original))
+            after = len(_build_message("from@example.com", "reply@example.com", "", "to@example.com",
+                                       template.render(**context)))
+            html_size = len("".join(template.html.segments).encode())
+            source_size = len(source.encode())
+
+            self.stdout.write(
+                f"{name:>12}: html {source_size} -> {html_size} bytes ({1 - html_size / source_size:.0%} smaller)"
+                f"  text part {len(''.join(template.text.segments).encode())} bytes"
+                f"  message {before} -> {after} bytes ({1 - after / before:.0%} smaller)"
+            )
@@ -0,0 +1,91 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from backend.models import ApplicationStatus, FileBlob
+from backend.uploads import file_sha256
+
+
+class Command(BaseCommand):
+    help = ("Move writing-task files saved under writing_task/user_<id>/ into the content-addressed layout, "
+            "then check every blob's reference count against the applications using it")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+
+    def handle(self, *args, **options):
+        storage = ApplicationStatus._meta.get_field("writing_task_file").storage
+        self.dry_run = options["dry_run"]
+        moved = deduplicated = missing = 0
+        legacy = ApplicationStatus.objects.exclude(writing_task_file="").exclude(writing_task_file=None)\
+            .values_list("pk", "writing_task_file", "writing_task_sha256")
+        for pk, name, sha256 in legacy.iterator():
+            if storage.is_blob(name):
+                continue
+            path = storage.path(name)
+            if os.path.exists(path):
+                sha256 = file_sha256(path)
+            elif not (sha256 and storage.exists(storage.blob_name(sha256, os.path.splitext(name)[1]))):
+                # neither the old file nor its blob (from an interrupted run) is there
+                self.stderr.write(f"missing: {name}")
+                missing += 1
+                continue
+            blob = storage.blob_name(sha256, os.path.splitext(name)[1])
+            if storage.exists(blob):
+                deduplicated += 1
+            else:
+                moved += 1
+            if self.dry_run:
+                continue
+            self.move(storage, path, blob)
+            with transaction.atomic():
+                # update() leaves modified_at alone: the application itself has not changed
+                ApplicationStatus.objects.filter(pk=pk).update(writing_task_file=blob, writing_task_sha256=sha256)
+                self.reference(blob, sha256, storage.size(blob))
+        self.stdout.write(f"moved {moved} files, {deduplicated} were duplicates, {missing} missing")
+        self.check_refcounts(storage)
+
+    def move(self, storage, path, blob):
+        target = storage.path(blob)
+        if os.path.exists(path):
+            if os.path.exists(target):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+        try:
+            os.removedirs(os.path.dirname(path))
+        except OSError:
+            pass  # other files are still in the directory
+
+    def reference(self, blob, sha256, size):
+        if not FileBlob.objects.filter(name=blob).update(refcount=F("refcount") + 1):
+            FileBlob.objects.create(name=blob, sha256=sha256, size=size, refcount=1)
+
+    def check_refcounts(self, storage):
+        """Fix reference counts that drifted, e.g. when a request failed after storing its file."""
+        used = dict(ApplicationStatus.objects.filter(writing_task_file__startswith=f"{storage.prefix}/")
+                    .values_list("writing_task_file").annotate(count=Count("pk")).order_by())
+        fixed = 0
+        for blob in FileBlob.objects.iterator():
+            count = used.pop(blob.name, 0)
+            if count == blob.refcount:
+                continue
+            fixed += 1
+            if self.dry_run:
+                continue
+            if count:
+                FileBlob.objects.filter(pk=blob.pk).update(refcount=count)
+            else:
+                blob.delete()
+                storage.purge(blob.name)
+        for name, count in used.items():
+            if not storage.is_blob(name) or not storage.exists(name):
+                continue
+            fixed += 1
+            if not self.dry_run:
+                FileBlob.objects.create(name=name, sha256=os.path.basename(name)[:64], size=storage.size(name),
+                                        refcount=count)
+        self.stdout.write(f"fixed {fixed} reference counts")
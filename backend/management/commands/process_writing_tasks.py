@@ -0,0 +1,39 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.documents import pdf_executor, process_batch, requeue
+
+
+class Command(BaseCommand):
+    help = ("Read the submitted writing-task PDFs in a pool of worker processes, recording page count, text and "
+            "a first-page thumbnail, and marking the files that do not parse")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                            help="PDFs parsed at the same time, one per process")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--lease", type=int, default=600,
+                            help="seconds after which files claimed by a dead worker are processed again")
+        parser.add_argument("--requeue", choices=["all", "failed"],
+                            help="process already processed files (all) or the ones that failed again first")
+        parser.add_argument("--loop", action="store_true", help="keep polling for new submissions instead of exiting")
+        parser.add_argument("--interval", type=float, default=10.0, help="seconds to wait between polls with --loop")
+
+    def handle(self, *args, **options):
+        if options["requeue"]:
+            self.stdout.write(f"requeued {requeue(failed_only=options['requeue'] == 'failed')} files")
+        totals = {}
+        with pdf_executor(options["workers"]) as executor:
+            while True:
+                summary = process_batch(executor, options["batch_size"], options["lease"])
+                for state, count in summary.items():
+                    totals[state] = totals.get(state, 0) + count
+                if summary:
+                    self.stdout.write(", ".join(f"{state}: {count}" for state, count in sorted(summary.items())))
+                elif not options["loop"]:
+                    break
+                else:
+                    time.sleep(options["interval"])
+        self.stdout.write("total: " + (", ".join(f"{state}: {count}" for state, count in sorted(totals.items())) or "0"))
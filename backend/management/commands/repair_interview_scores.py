@@ -0,0 +1,38 @@
+from math import isclose
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from backend.models import ApplicationStatus
+
+
+def close(a, b):
+    # sums kept by adding and subtracting floats may be off in the last digits
+    return a is b is None or (a is not None and b is not None and isclose(a, b, abs_tol=1e-9))
+
+
+class Command(BaseCommand):
+    help = ("Recompute every application's interview score sum, count and average from its scores, "
+            "fixing those that drifted")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            totals = ApplicationStatus.interview_score_totals()
+            stored = ApplicationStatus.objects.filter(Q(score_count__gt=0) | Q(avgInterviewScore__isnull=False))\
+                .values_list("pk", "score_sum", "score_count", "avgInterviewScore")
+            # applications stored as scored, then those that have scores but are not
+            drifted = {}
+            for pk, total, count, average in stored.iterator():
+                expected_total, expected_count = totals.pop(pk, (0.0, 0))
+                expected_average = expected_total / expected_count if expected_count else None
+                if count != expected_count or not close(total, expected_total) or not close(average, expected_average):
+                    drifted[pk] = (expected_total, expected_count)
+            drifted.update(totals)
+            if not options["dry_run"]:
+                for pk, (total, count) in drifted.items():
+                    ApplicationStatus.set_interview_scores(pk, total, count)
+        self.stdout.write(f"fixed {len(drifted)} applications")
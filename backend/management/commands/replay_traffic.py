@@ -0,0 +1,214 @@
+"""
+Replay captured API traffic and report throughput, latency, errors and
+queries per endpoint.
+
+The capture is JSON lines, one request per line, in timestamp order:
+
+    {"ts": 1718000000.25, "client": "10.0.0.7", "method": "POST", "path": "/api/v1/applicants/",
+     "json": {...}}
+    {"ts": 1718000003.5, "method": "PUT", "path": "/api/v1/applicants/writing-tasks/files/<uuid>",
+     "data": {"handle_by": "IT"}, "files": {"writing_task_file": {"name": "task.pdf", "size": 482133}}}
+    {"ts": 1718000004.0, "method": "PUT", "path": "/api/v1/applicants/writing-tasks/uploads/sessions/<uuid>",
+     "headers": {"Upload-Offset": "0"}, "body_size": 1048576}
+
+``json`` is sent as an application/json body, ``data`` and ``files`` as a
+multipart form, and ``body_size`` as a raw body. File contents are synthetic
+PDFs of the recorded size. A POST that opens an upload session may carry
+the ``session`` id it was given when captured; later requests for that
+session then wait for it and use the new id. Lines without a method and a
+path are skipped.
+"""
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from backend.benchmark import latency_report
+from backend.models import Applicant, ApplicationStatus
+
+REPLAY_SRC = "replay_traffic"
+UUID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+# paths whose UUID is an applicant, as opposed to an upload session
+APPLICANT_PATH = re.compile(rf"/applicants/writing-tasks/(?:files/|uploads/)?({UUID_PATTERN})(?:\.\w+)?$")
+SESSION_PATH = re.compile(rf"/uploads/sessions/({UUID_PATTERN})")
+
+
+def synthetic_pdf(size):
+    header, trailer = b"%PDF-1.7\n", b"\n%%EOF\n"
+    return (header + b"%" * max(0, size - len(header) - len(trailer)) + trailer)[:max(size, len(header))]
+
+
+def endpoint(method, path):
+    return f"{method} {re.sub(UUID_PATTERN, '<pk>', path)}"
+
+
+class Command(BaseCommand):
+    help = ("Replay a JSON lines capture of API requests, in process or against a running server, and "
+            "report per-endpoint throughput, latency percentiles, error rates and DB queries")
+
+    def add_arguments(self, parser):
+        parser.add_argument("capture", help="JSON lines file of recorded requests")
+        parser.add_argument("--speedup", type=float, default=1.0,
+                            help="replay this many times faster than recorded; 0 sends as fast as possible")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--url", help="base URL of a server using this project's database, e.g. "
+                                          "http://localhost:8000; by default requests are handled in process, "
+                                          "which also counts queries")
+
+    def handle(self, *args, **options):
+        records, skipped = self.load(options["capture"])
+        if not records:
+            raise CommandError(f"no requests in {options['capture']} ({skipped} lines skipped)")
+        self.stdout.write(f"replaying {len(records)} requests ({skipped} lines skipped)")
+        self.base_url = options["url"]
+        self.seed(records)
+        media_root = tempfile.mkdtemp()
+        try:
+            overrides = {} if self.base_url else dict(DEBUG=False, ALLOWED_HOSTS=["testserver"], MEDIA_ROOT=media_root)
+            with override_settings(**overrides):
+                results, elapsed = self.replay(records, options["speedup"], options["concurrency"])
+        finally:
+            Applicant.objects.filter(src=REPLAY_SRC).delete()
+            shutil.rmtree(media_root, ignore_errors=True)
+        self.report(results, elapsed)
+
+    def load(self, capture):
+        records, skipped = [], 0
+        with open(capture) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if not isinstance(record, dict) or not record.get("method") or not record.get("path"):
+                    skipped += 1
+                    continue
+                if isinstance(record.get("json"), dict) and record["path"].rstrip("/").endswith("/applicants"):
+                    # tag new applicants so they are deleted with the seeded ones
+                    record["json"] = {**record["json"], "src": REPLAY_SRC}
+                records.append(record)
+        records.sort(key=lambda record: record.get("ts", 0))
+        return records, skipped
+
+    def seed(self, records):
+        """Create an applicant, with an application per department it is used with, for every UUID in the paths."""
+        depts = defaultdict(set)
+        for record in records:
+            match = APPLICANT_PATH.search(record["path"])
+            if match:
+                fields = record.get("json") or record.get("data") or {}
+                depts[UUID(match.group(1))].add(fields.get("handle_by") or "IT")
+        existing = set(Applicant.objects.filter(pk__in=depts).values_list("pk", flat=True))
+        applicants = Applicant.objects.bulk_create([
+            Applicant(id=pk, name="回放", email="replay@example.com", phone="13800000000", school="replay",
+                      major="replay", grade="UG1", wechat="replay", first_choice=sorted(depts[pk])[0],
+                      self_intro="replay", disposable_time=1, src=REPLAY_SRC)
+            for pk in depts if pk not in existing
+        ])
+        ApplicationStatus.objects.bulk_create([
+            ApplicationStatus(applicant=applicant, handle_by=dept, status="WRTIING_TASK_EMAIL_SENT")
+            for applicant in applicants for dept in depts[applicant.pk]
+        ])
+        self.sessions = {record["session"]: threading.Event() for record in records if record.get("session")}
+        self.session_ids = {}
+        self.stdout.write(f"seeded {len(applicants)} applicants, {len(existing)} already existed")
+
+    def build(self, record):
+        """``(path, body, content_type, headers)`` for a record, with upload-session ids mapped to live ones."""
+        path = record["path"]
+        match = SESSION_PATH.search(path)
+        if match and match.group(1) in self.sessions:
+            self.sessions[match.group(1)].wait(timeout=30)
+            path = path.replace(match.group(1), self.session_ids.get(match.group(1), match.group(1)))
+        headers = dict(record.get("headers") or {})
+        if record.get("json") is not None:
+            return path, json.dumps(record["json"]).encode(), "application/json", headers
+        if record.get("files") or record.get("data"):
+            form = dict(record.get("data") or {})
+            for field, file in (record.get("files") or {}).items():
+                form[field] = SimpleUploadedFile(file.get("name", "task.pdf"), synthetic_pdf(file.get("size", 0)))
+            return path, encode_multipart(BOUNDARY, form), MULTIPART_CONTENT, headers
+        if record.get("body_size"):
+            offset = int(headers.get("Upload-Offset", 0))
+            body = synthetic_pdf(offset + record["body_size"])[offset:]
+            return path, body, "application/octet-stream", headers
+        return path, b"", None, headers
+
+    def send(self, record):
+        """``(status, queries)`` for one request; queries is None for a remote server."""
+        path, body, content_type, headers = self.build(record)
+        if self.base_url:
+            request = urllib.request.Request(self.base_url.rstrip("/") + path, data=body or None,
+                                             method=record["method"], headers=headers)
+            if content_type:
+                request.add_header("Content-Type", content_type)
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return response.status, response.read(), None
+            except urllib.error.HTTPError as e:
+                return e.code, e.read(), None
+        client = Client(REMOTE_ADDR=record.get("client", "127.0.0.1"))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.generic(record["method"], path, body, content_type=content_type or "", headers=headers)
+        return response.status_code, response.content, len(queries)
+
+    def run(self, record, scheduled):
+        try:
+            status, content, queries = self.send(record)
+        except Exception as e:
+            self.stderr.write(f"{record['method']} {record['path']}: {e!r}")
+            status, content, queries = None, b"", None
+        finally:
+            latency = time.perf_counter() - scheduled
+            connection.close()
+        if record.get("session") in self.sessions:
+            try:
+                self.session_ids[record["session"]] = json.loads(content)["id"]
+            except (ValueError, KeyError, TypeError):
+                pass
+            self.sessions[record["session"]].set()
+        return endpoint(record["method"], record["path"]), status, latency, queries
+
+    def replay(self, records, speedup, concurrency):
+        first = records[0].get("ts", 0)
+        futures = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for record in records:
+                # latency counts from the recorded send time, so queueing behind a slow server shows up in it
+                scheduled = start + (record.get("ts", first) - first) / speedup if speedup else time.perf_counter()
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                futures.append(executor.submit(self.run, record, scheduled))
+        return [future.result() for future in futures], time.perf_counter() - start
+
+    def report(self, results, elapsed):
+        by_endpoint = defaultdict(list)
+        for result in results:
+            by_endpoint[result[0]].append(result[1:])
+        for name, rows in sorted(by_endpoint.items()):
+            failures = sum(1 for status, _, _ in rows if status is None or status >= 500)
+            rejected = sum(1 for status, _, _ in rows if status is not None and 400 <= status < 500)
+            queries = [count for _, _, count in rows if count is not None]
+            line = (f"{name}\n  {latency_report([latency for _, latency, _ in rows], elapsed, failures)}"
+                    f"  4xx {rejected}  error rate {failures / len(rows):.1%}")
+            if queries:
+                line += f"  {sum(queries) / len(queries):.1f} queries/request (max {max(queries)})"
+            self.stdout.write(line)
+        self.stdout.write(f"total: {latency_report([row[2] for row in results], elapsed)}")
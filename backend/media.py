@@ -0,0 +1,188 @@
+"""
+Serving writing-task files to staff.
+
+``/media-files/application/<pk>`` checks that the user may see the
+application, with the same department scope as the admin, and redirects
+to a signed URL that expires after MEDIA_SIGNED_URL_MAX_AGE seconds. The
+signed URL is checked without touching the database. With
+MEDIA_ACCEL_REDIRECT set, the transfer is handed to nginx through
+X-Accel-Redirect, and nginx also serves the Range requests. Without it,
+the file is streamed from here: whole files through the server's
+sendfile (wsgi.file_wrapper), and ranges in chunks.
+"""
+import io
+import os
+import re
+import zipfile
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from .models import ApplicationStatus, getDeptName
+from .permissions import department_scope
+from .uploads import CHUNK_SIZE
+
+SIGNING_SALT = "backend.media"
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def download_name(application):
+    """``<applicant>-<department><ext>``, the name a reviewer saves the writing task under."""
+    _, ext = os.path.splitext(application.writing_task_file.name)
+    return f"{application.applicant.name}-{getDeptName(application.handle_by)}{ext}"
+
+
+def signed_url(application):
+    token = signing.dumps({"name": application.writing_task_file.name, "filename": download_name(application)},
+                          salt=SIGNING_SALT, compress=True)
+    return reverse("media-file", args=[token])
+
+
+@require_safe
+@staff_member_required
+def writing_task_file(request, pk):
+    queryset = department_scope(request.user, ApplicationStatus.objects.select_related("applicant"), "handle_by")
+    application = get_object_or_404(queryset, pk=pk)
+    if not application.writing_task_file:
+        raise Http404("No writing task file")
+    return HttpResponseRedirect(signed_url(application))
+
+
+@require_safe
+def media_file(request, token):
+    try:
+        signed = signing.loads(token, salt=SIGNING_SALT, max_age=getattr(settings, "MEDIA_SIGNED_URL_MAX_AGE", 3600))
+    except signing.BadSignature:  # also raised when the URL has expired
+        return HttpResponse("Link expired or invalid", status=403)
+
+    storage = ApplicationStatus._meta.get_field("writing_task_file").storage
+    name, filename = signed["name"], signed["filename"]
+    accel = getattr(settings, "MEDIA_ACCEL_REDIRECT", None)
+    if accel:
+        response = HttpResponse(content_type="application/pdf")
+        response["X-Accel-Redirect"] = quote(accel.rstrip("/") + "/" + name)
+    else:
+        try:
+            response = _file_response(request, storage.path(name))
+        except FileNotFoundError:
+            raise Http404("File not found")
+    response["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+    # the URL is only valid for a while, but what it points to never changes
+    response["Cache-Control"] = f"private, max-age={getattr(settings, 'MEDIA_SIGNED_URL_MAX_AGE', 3600)}, immutable"
+    return response
+
+
+def _file_response(request, path):
+    size = os.path.getsize(path)
+    byte_range = _parse_range(request.META.get("HTTP_RANGE", ""), size)
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type="application/pdf")
+    elif byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type="application/pdf")
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = str(end - start + 1)
+    response["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _parse_range(header, size):
+    """``(start, end)`` for a single satisfiable range, False if unsatisfiable, None to send the whole file."""
+    match = RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # no Range, or several ranges: sending the whole file is always allowed
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class _Pipe(io.RawIOBase):
+    """An unseekable file that keeps what is written until it is drained; zipfile then writes data descriptors."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def stream_zip(entries):
+    """
+    Yield a ZIP archive of ``(arcname, path)`` entries as it is written,
+    reading each file in chunks: nothing is buffered beyond one chunk.
+    Entries are stored uncompressed, as PDFs barely compress anyway.
+    """
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, path in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as source, \
+                    archive.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    yield from pipe.drain()
+            yield from pipe.drain()
+    yield from pipe.drain()
+
+
+def writing_tasks_zip(applications, filename):
+    """A download of the writing-task files of ``applications``, named after their applicants and departments."""
+    entries, seen = [], {}
+    for application in applications:
+        if not application.writing_task_file:
+            continue
+        path = application.writing_task_file.path
+        if not os.path.exists(path):
+            continue
+        name = download_name(application)
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            base, ext = os.path.splitext(name)
+            name = f"{base} ({seen[name]}){ext}"
+        entries.append((name, path))
+
+    response = StreamingHttpResponse(stream_zip(entries), content_type="application/zip")
+    response["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    # start sending at once instead of nginx collecting the archive first
+    response["X-Accel-Buffering"] = "no"
+    return response
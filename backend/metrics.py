@@ -0,0 +1,130 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds in seconds, the last bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+# upper bounds in bytes, for upload sizes
+SIZE_BUCKETS = tuple(2 ** 10 * 4 ** i for i in range(8)) + (float("inf"), )
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum, in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (0 to 1)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def snapshot(self):
+        """``(counts, sum, count)``, read together."""
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def summary(self):
+        mean = self.sum / self.count if self.count else 0.0
+        return (f"n={self.count} mean={mean * 1000:.1f} ms p50<={self.quantile(0.5) * 1000:g} ms "
+                f"p95<={self.quantile(0.95) * 1000:g} ms p99<={self.quantile(0.99) * 1000:g} ms")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+_histograms = {}
+_counters = {}
+_histograms_lock = threading.Lock()
+
+# stage -> seconds of the send currently being traced in this thread or task
+_current_trace = contextvars.ContextVar("email_trace", default=None)
+
+
+def histogram(name, buckets=LATENCY_BUCKETS, **labels):
+    """The process-wide histogram for ``name`` and ``labels``, created on first use."""
+    key = (name, tuple(sorted(labels.items())))
+    with _histograms_lock:
+        if key not in _histograms:
+            _histograms[key] = Histogram(buckets)
+        return _histograms[key]
+
+
+def histograms():
+    """A snapshot of ``{(name, labels): Histogram}`` for exporting."""
+    with _histograms_lock:
+        return dict(_histograms)
+
+
+def counter(name, **labels):
+    """The process-wide counter for ``name`` and ``labels``, created on first use."""
+    key = (name, tuple(sorted(labels.items())))
+    with _histograms_lock:
+        if key not in _counters:
+            _counters[key] = Counter()
+        return _counters[key]
+
+
+def counters():
+    """A snapshot of ``{(name, labels): Counter}`` for exporting."""
+    with _histograms_lock:
+        return dict(_counters)
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def observe(stage, seconds, **labels):
+    """Record ``seconds`` for ``stage`` in its histogram and in the current trace, if any."""
+    histogram("email_stage_seconds", stage=stage, **labels).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time the block as ``stage``; the time is recorded even if the block raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def trace():
+    """Collect the stages timed inside the block into the yielded ``{stage: seconds}`` dict."""
+    durations = {}
+    token = _current_trace.set(durations)
+    try:
+        yield durations
+    finally:
+        _current_trace.reset(token)
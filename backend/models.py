@@ -1,7 +1,11 @@
 from datetime import timedelta
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, When
 from .email import *
+from .storage import writing_task_storage
+from .uploads import upload_temp_dir
+import os
 import uuid
 from django.utils import timezone
 
@@ -78,6 +82,13 @@ class Applicant(models.Model):
         verbose_name_plural = "申请人信息"
         db_table = "申请人信息表"
         ordering = ["created_at"]
+        # the admin filters by each of these and lists in created_at order
+        indexes = [
+            models.Index(fields=["first_choice", "created_at"]),
+            models.Index(fields=["second_choice", "created_at"]),
+            models.Index(fields=["grade", "created_at"]),
+            models.Index(fields=["src", "created_at"]),
+        ]
         
     def __str__(self):
         return self.name
@@ -104,7 +115,7 @@ class ApplicationStatus(models.Model):
     ]
     
     def user_directory_path(instance, filename):
-        # file will be uploaded to MEDIA_ROOT/user_<id>/<filename>
+        # writing_task_storage stores files by content hash and only keeps the extension of this name
         return f"writing_task/user_{instance.applicant.id}/{instance.handle_by}-{filename}"
     
     def calculate_ddl():
@@ -119,7 +130,8 @@ class ApplicationStatus(models.Model):
     handle_by = models.CharField(max_length=3, choices=DEPARTMENTS, verbose_name="处理部门", blank=False)
         
     writing_task_ddl = models.DateTimeField(verbose_name="笔试截止时间", default=calculate_ddl, blank=False)
-    writing_task_file = models.FileField(upload_to=user_directory_path,  verbose_name="笔试文件", blank=True, null=True, )
+    writing_task_file = models.FileField(upload_to=user_directory_path, storage=writing_task_storage, verbose_name="笔试文件", blank=True, null=True, )
+    writing_task_sha256 = models.CharField(max_length=64, verbose_name="笔试文件SHA-256", blank=True, null=True, editable=False)
     writing_task_video_link = models.URLField(verbose_name="试讲视频链接", blank=True, null=True)
     
     interview_time = models.DateTimeField(verbose_name="面试时间", blank=True, null=True)
@@ -127,7 +139,10 @@ class ApplicationStatus(models.Model):
     interview_uploaded_to_feishu = models.BooleanField(verbose_name="面试记录已上传至飞书", default=False)
     
     writiing_task_score = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)], verbose_name="笔试总分", blank=True, null=True)
-    avgInterviewScore = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)], verbose_name="面试平均", blank=True, null=True)
+    avgInterviewScore = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(100.0)], verbose_name="面试平均", blank=True, null=True, editable=False)
+    # kept up to date by the InterviewScore signals, avgInterviewScore is score_sum / score_count
+    score_sum = models.FloatField(verbose_name="面试总分合计", default=0.0, editable=False)
+    score_count = models.IntegerField(verbose_name="面试评分数", default=0, editable=False)
     
     writing_task_comment = models.TextField(verbose_name="笔试备注", blank=True, null=True)
     remark = models.TextField(verbose_name="备注", blank=True, null=True)
@@ -135,12 +150,40 @@ class ApplicationStatus(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     modified_at = models.DateTimeField(auto_now=True, editable=False)
     
-    def update_avgInterviewScore(self):
-        interview_scores = self.interview_scores.all()
-        if interview_scores:
-            self.avgInterviewScore = sum(score.score for score in interview_scores) / len(interview_scores)
-        else:
-            self.avgInterviewScore = None
+    SCORE_FIELDS = ["score_sum", "score_count", "avgInterviewScore"]
+
+    @staticmethod
+    def adjust_interview_scores(pk, score, count):
+        """Add ``score`` to the score sum and ``count`` to the number of scores of application ``pk``, in one UPDATE."""
+        # every F() reads the row as it was before this UPDATE; the sum of no scores is
+        # set to exactly 0 so rounding errors do not outlive the scores
+        ApplicationStatus.objects.filter(pk=pk).update(
+            score_sum=Case(When(score_count=-count, then=0.0), default=F("score_sum") + score),
+            score_count=F("score_count") + count,
+            avgInterviewScore=Case(When(score_count=-count, then=None),
+                                   default=(F("score_sum") + score) / (F("score_count") + count),
+                                   output_field=FloatField()))
+
+    @staticmethod
+    def set_interview_scores(pk, total, count):
+        ApplicationStatus.objects.filter(pk=pk).update(score_sum=total, score_count=count,
+                                                       avgInterviewScore=total / count if count else None)
+
+    @staticmethod
+    def interview_score_totals(**filters):
+        """``{application_id: (score_sum, score_count)}`` for the applications with scores, in one grouped query."""
+        totals = InterviewScore.objects.filter(**filters).order_by().values("application")\
+            .annotate(total=Sum("score"), count=Count("pk")).values_list("application", "total", "count")
+        return {pk: (total, count) for pk, total, count in totals}
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # The score columns are written by adjust_interview_scores only, so the UPDATE of a
+        # full save leaves them out and an instance loaded earlier cannot overwrite scores
+        # added since. An INSERT (a new row, force_insert, re-saving a deleted row) writes
+        # them as usual, and so does a save naming them in update_fields.
+        if update_fields is None:
+            values = [value for value in values if value[0].name not in self.SCORE_FIELDS]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
     
     @property
     def totalScore(self):
@@ -154,7 +197,14 @@ class ApplicationStatus(models.Model):
         verbose_name_plural = "部门申请"
         db_table = "部门申请表"
         ordering = ["handle_by", "status", "created_at"]
+        # the unique index of unique_together also serves lookups by (applicant, handle_by)
         unique_together = ["applicant", "handle_by"]
+        indexes = [
+            # the admin filters by department and status and lists in this order
+            models.Index(fields=["handle_by", "status", "created_at"]),
+            # check_writing_task_expired
+            models.Index(fields=["status", "writing_task_ddl"]),
+        ]
         permissions = [
             ("send_decision_email", "可以发送结果通知邮件"),
         ]
@@ -162,14 +212,24 @@ class ApplicationStatus(models.Model):
     def __str__(self):
         return f"{self.applicant.name} - {getDeptName(self.handle_by)}"
     
+    def _deliver(self, kind, send, subject, content):
+        """Send with retries; an email that still fails is recorded in the FailedEmail dead-letter table."""
+        try:
+            send(self.applicant.email, subject, content, raise_errors=True)
+        except EmailDeliveryError as e:
+            FailedEmail.record(self, kind, e)
+            return False
+        self.failed_emails.filter(kind=kind, resolved=False).update(resolved=True, modified_at=timezone.now())
+        return True
+    
     def send_writing_task_email(self):
         if self.status != "NEW_APPLICATION":
             return False
         self.writing_task_ddl = ApplicationStatus.calculate_ddl()
         self.save()
-        res = send_email_with_no_reply(self.applicant.email, "SAGA星光·第五期 -- 笔试邀请",
-                                 compose_writing_task_email(self.applicant.id, self.applicant.name,
-                                                            self.handle_by, timezone.localtime(self.writing_task_ddl)))
+        res = self._deliver("WRITING_TASK", send_email_with_no_reply, "SAGA星光·第五期 -- 笔试邀请",
+                            compose_writing_task_email(self.applicant.id, self.applicant.name,
+                                                       self.handle_by, timezone.localtime(self.writing_task_ddl)))
         if res:
             self.status = "WRTIING_TASK_EMAIL_SENT"
             self.save()
@@ -181,9 +241,9 @@ class ApplicationStatus(models.Model):
             return False
         if self.interview_time is None or self.interviewer is None:
             return False
-        res = send_email_with_no_reply(self.applicant.email, "SAGA星光·第五期 -- 面试邀请",
-                                 compose_interview_email(self.applicant.name, self.handle_by,
-                                                         timezone.localtime(self.interview_time), self.interviewer.meeting_link))
+        res = self._deliver("INTERVIEW", send_email_with_no_reply, "SAGA星光·第五期 -- 面试邀请",
+                            compose_interview_email(self.applicant.id, self.applicant.name, self.handle_by,
+                                                    timezone.localtime(self.interview_time), self.interviewer.meeting_link))
         if res:
             self.status = "INTERVIEW_EMAIL_SENT"
             self.save()
@@ -194,11 +254,12 @@ class ApplicationStatus(models.Model):
         if self.status not in ["INTERNAL_ACCEPTED", "INTERNAL_REJECTED"]:
             return False
         if self.status == "INTERNAL_ACCEPTED":
-            res = send_email_with_HR(self.applicant.email, "SAGA星光·第五期 -- 录取通知",
-                                     compose_accept_email(self.applicant.name, self.handle_by))
+            res = self._deliver("DECISION", send_offer_email_with_hr, "SAGA星光·第五期 -- 录取通知",
+                                compose_accept_email(self.applicant.id, self.applicant.name, self.handle_by,
+                                                     timezone.localtime(ApplicationStatus.calculate_ddl())))
         else:
-            res = send_email_with_HR(self.applicant.email, "SAGA星光·第五期 -- 拒绝通知",
-                                     compose_reject_email(self.applicant.name, self.handle_by))
+            res = self._deliver("DECISION", send_reject_email_with_hr, "SAGA星光·第五期 -- 拒绝通知",
+                                compose_reject_email(self.applicant.id, self.applicant.name, self.handle_by))
         if res:
             if self.status == "INTERNAL_ACCEPTED":
                 self.status = "ACCEPTED"
@@ -249,7 +310,273 @@ class InterviewScore(models.Model):
         ordering = ["application", "interviewer"]
         unique_together = ["application", "interviewer"]
     
+    # (application_id, score) as last read from or written to the database, see signals.py
+    _saved_score = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if "application_id" in loaded and "score" in loaded:
+            instance._saved_score = (loaded["application_id"], loaded["score"])
+        return instance
+
+    def save(self, *args, **kwargs):
+        # the post_save signal adjusts the application's score columns in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.application.applicant.name} - {getDeptName(self.application.handle_by)} - {self.interviewer}"
     
 
+
+
+
+class EmailOutbox(models.Model):
+    KINDS = [
+        ("WRITING_TASK", "笔试邀请"),
+        ("INTERVIEW", "面试邀请"),
+        ("DECISION", "录取/拒绝通知"),
+    ]
+
+    # the application statuses each kind of email is sent in
+    SEND_STATUSES = {
+        "WRITING_TASK": ["NEW_APPLICATION"],
+        "INTERVIEW": ["INTERVIEW_PENDING"],
+        "DECISION": ["INTERNAL_ACCEPTED", "INTERNAL_REJECTED"],
+    }
+
+    STATES = [
+        ("PENDING", "待发送"),
+        ("SENDING", "发送中"),
+        ("SENT", "已发送"),
+        ("SKIPPED", "已跳过"),
+        ("FAILED", "发送失败"),
+    ]
+
+    id = models.AutoField(primary_key=True)
+
+    application = models.ForeignKey("ApplicationStatus", on_delete=models.CASCADE, related_name="outbox", verbose_name="部门申请", blank=False)
+    kind = models.CharField(max_length=20, choices=KINDS, verbose_name="邮件类型", default="WRITING_TASK")
+    state = models.CharField(max_length=10, choices=STATES, verbose_name="发送状态", default="PENDING")
+    attempts = models.IntegerField(verbose_name="尝试次数", default=0)
+    last_error = models.TextField(verbose_name="最近错误", blank=True, null=True)
+
+    claimed_at = models.DateTimeField(verbose_name="领取时间", blank=True, null=True)
+    # a failed email waits until then before it is claimed again
+    next_attempt_at = models.DateTimeField(verbose_name="下次尝试时间", blank=True, null=True)
+    sent_at = models.DateTimeField(verbose_name="发送时间", blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = "邮件发送队列"
+        verbose_name_plural = "邮件发送队列"
+        db_table = "邮件发送队列表"
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["state", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.application} - {self.get_kind_display()}"
+
+    @classmethod
+    def enqueue(cls, applications, kind):
+        """Queue ``kind`` emails for the applications in a status to receive them; returns how many were queued."""
+        queued = applications.filter(status__in=cls.SEND_STATUSES[kind])\
+            .exclude(outbox__kind=kind, outbox__state__in=["PENDING", "SENDING"])
+        if kind == "INTERVIEW":
+            queued = queued.exclude(interview_time=None).exclude(interviewer=None)
+        return len(cls.objects.bulk_create([cls(application_id=pk, kind=kind)
+                                            for pk in queued.order_by().values_list("pk", flat=True).distinct()]))
+
+    def deliver(self):
+        """Send the queued email; returns the new state."""
+        application = self.application
+        if application.status not in self.SEND_STATUSES[self.kind]:
+            return "SKIPPED"
+        if self.kind == "INTERVIEW" and (application.interview_time is None or application.interviewer is None):
+            return "SKIPPED"
+        if getattr(application, FailedEmail.SEND_METHODS[self.kind])():
+            return "SENT"
+        return "FAILED"
+
+
+
+class RateLimitBucket(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "限流令牌桶"
+        verbose_name_plural = "限流令牌桶"
+        db_table = "限流令牌桶表"
+
+    def __str__(self):
+        return self.key
+
+
+
+class UploadSession(models.Model):
+    STATES = [
+        ("OPEN", "上传中"),
+        ("COMPLETED", "已完成"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    application = models.ForeignKey("ApplicationStatus", on_delete=models.CASCADE, related_name="upload_sessions", verbose_name="部门申请", blank=False)
+    file_name = models.CharField(max_length=100, verbose_name="文件名")
+    size = models.IntegerField(verbose_name="文件大小(字节)")
+    received = models.IntegerField(verbose_name="已接收(字节)", default=0)
+    state = models.CharField(max_length=10, choices=STATES, verbose_name="上传状态", default="OPEN")
+
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = "断点续传会话"
+        verbose_name_plural = "断点续传会话"
+        db_table = "断点续传会话表"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.application} - {self.file_name}"
+
+    @property
+    def part_path(self):
+        """Where the chunks are assembled until the upload is finalized."""
+        return os.path.join(upload_temp_dir(), f"{self.id}.part")
+
+    def delete_part(self):
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+
+
+class EmailSendLog(models.Model):
+    RESULTS = [
+        ("SENT", "已发送"),
+        ("FAILED", "发送失败"),
+    ]
+
+    id = models.AutoField(primary_key=True)
+
+    recipient_hash = models.CharField(max_length=64, verbose_name="收件人哈希", db_index=True)
+    sender = models.CharField(max_length=50, verbose_name="发件人")
+    template = models.CharField(max_length=30, verbose_name="邮件模板", blank=True, null=True)
+    size = models.IntegerField(verbose_name="邮件大小(字节)")
+    durations = models.JSONField(verbose_name="各阶段耗时(毫秒)", default=dict)
+    duration = models.FloatField(verbose_name="总耗时(毫秒)")
+    attempts = models.IntegerField(verbose_name="尝试次数", default=1)
+    result = models.CharField(max_length=10, choices=RESULTS, verbose_name="发送结果")
+    error_code = models.IntegerField(verbose_name="SMTP错误码", blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, editable=False, db_index=True)
+
+    class Meta:
+        verbose_name = "邮件发送记录"
+        verbose_name_plural = "邮件发送记录"
+        db_table = "邮件发送记录表"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.sender} - {self.template} - {self.get_result_display()}"
+
+
+class FailedEmail(models.Model):
+    KINDS = [
+        ("WRITING_TASK", "笔试邀请"),
+        ("INTERVIEW", "面试邀请"),
+        ("DECISION", "录取/拒绝通知"),
+    ]
+
+    SEND_METHODS = {
+        "WRITING_TASK": "send_writing_task_email",
+        "INTERVIEW": "send_interview_email",
+        "DECISION": "send_decision_email",
+    }
+
+    id = models.AutoField(primary_key=True)
+
+    application = models.ForeignKey("ApplicationStatus", on_delete=models.CASCADE, related_name="failed_emails", verbose_name="部门申请", blank=False)
+    kind = models.CharField(max_length=20, choices=KINDS, verbose_name="邮件类型", blank=False)
+    recipient = models.EmailField(max_length=30, verbose_name="收件人", blank=False)
+    error = models.TextField(verbose_name="错误信息", blank=True, null=True)
+    error_code = models.IntegerField(verbose_name="SMTP错误码", blank=True, null=True)
+    permanent = models.BooleanField(verbose_name="永久失败", default=False)
+    attempts = models.IntegerField(verbose_name="尝试次数", default=0)
+    resolved = models.BooleanField(verbose_name="已重新发送", default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    modified_at = models.DateTimeField(auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = "发送失败邮件"
+        verbose_name_plural = "发送失败邮件"
+        db_table = "发送失败邮件表"
+        ordering = ["resolved", "-modified_at"]
+
+    def __str__(self):
+        return f"{self.application} - {self.get_kind_display()}"
+
+    @classmethod
+    def record(cls, application, kind, error):
+        """Add ``error`` to the open dead letter of this application and kind, creating it if needed."""
+        failed, _ = cls.objects.get_or_create(application=application, kind=kind, resolved=False,
+                                              defaults={"recipient": application.applicant.email})
+        failed.recipient = application.applicant.email
+        failed.error = str(error)
+        failed.error_code = error.code
+        failed.permanent = error.permanent
+        failed.attempts += error.attempts
+        failed.save()
+        return failed
+
+    def redrive(self):
+        """Send the email again through the application, which also moves its status on success."""
+        if self.resolved:
+            return False
+        return getattr(self.application, FailedEmail.SEND_METHODS[self.kind])()
+
+
+
+class FileBlob(models.Model):
+    """
+    A stored file and the number of applications referencing it (see storage.ContentAddressedStorage),
+    with what process_writing_tasks read from it.
+    """
+    STATES = [
+        ("PENDING", "待处理"),
+        ("PROCESSING", "处理中"),
+        ("DONE", "已处理"),
+        ("FAILED", "无法解析"),
+    ]
+
+    name = models.CharField(max_length=255, unique=True, verbose_name="存储路径")
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name="SHA-256")
+    size = models.BigIntegerField(verbose_name="文件大小(字节)")
+    refcount = models.PositiveIntegerField(default=0, verbose_name="引用数")
+
+    state = models.CharField(max_length=10, choices=STATES, verbose_name="处理状态", default="PENDING", db_index=True)
+    claimed_at = models.DateTimeField(verbose_name="开始处理时间", blank=True, null=True)
+    processed_at = models.DateTimeField(verbose_name="处理完成时间", blank=True, null=True)
+    page_count = models.IntegerField(verbose_name="页数", blank=True, null=True)
+    text = models.TextField(verbose_name="文本内容", blank=True, null=True)
+    thumbnail = models.CharField(max_length=255, verbose_name="首页缩略图", blank=True, null=True)
+    error = models.TextField(verbose_name="解析错误", blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        verbose_name = "文件存储"
+        verbose_name_plural = "文件存储"
+        db_table = "文件存储表"
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,150 @@
+"""
+The /metrics endpoint, in the Prometheus text format.
+
+Request, query, email and upload metrics are kept in this process by
+metrics.py, so a scrape costs no queries. The one exception is the number of
+applications per status and department: it comes from a single grouped
+query, cached for METRICS["STATUS_COUNTS_TTL"] seconds.
+"""
+import math
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.models import Count
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import metrics
+from .models import ApplicationStatus
+
+STATUS_COUNTS_KEY = "metrics:application-status-counts"
+
+
+class _QueryCount:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def record(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class MetricsMiddleware:
+    """
+    Counts requests, their latency and their queries, labelled with the view that handled them.
+
+    Works in both a sync and an async middleware chain. Connections are per
+    thread, so under ASGI the query wrappers are installed in the thread the
+    request's ORM calls run in (``sync_to_async`` is thread-sensitive), not in
+    the event loop's.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS", {}).get("ENABLED", True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _QueryCount()
+        start = time.perf_counter()
+        with queries.record():
+            response = self.get_response(request)
+        self.observe(request, response, queries, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        queries = _QueryCount()
+        start = time.perf_counter()
+        recording = await sync_to_async(queries.record)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        self.observe(request, response, queries, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, queries, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        metrics.counter("http_requests_total", view=view, method=request.method,
+                        status=str(response.status_code)).inc()
+        metrics.histogram("http_request_seconds", view=view, method=request.method).observe(elapsed)
+        metrics.counter("db_queries_total", view=view).inc(queries.count)
+
+
+def status_counts():
+    """``[(status, handle_by, count)]`` for every application, at most STATUS_COUNTS_TTL seconds old."""
+    counts = cache.get(STATUS_COUNTS_KEY)
+    if counts is None:
+        counts = [(row["status"], row["handle_by"], row["count"]) for row in
+                  ApplicationStatus.objects.order_by().values("status", "handle_by").annotate(count=Count("pk"))]
+        cache.set(STATUS_COUNTS_KEY, counts, getattr(settings, "METRICS", {}).get("STATUS_COUNTS_TTL", 30))
+    return counts
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return str(value)
+
+
+def render_metrics():
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), counter in sorted(metrics.counters().items()):
+        declare(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {counter.value}")
+
+    for (name, labels), histogram in sorted(metrics.histograms().items()):
+        declare(name, "histogram")
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)), ))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    declare("applications", "gauge")
+    for status, handle_by, count in status_counts():
+        lines.append(f"applications{_labels((('handle_by', handle_by), ('status', status)))} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    allowed = getattr(settings, "METRICS", {}).get("ALLOWED_IPS")
+    if allowed and request.META.get("REMOTE_ADDR") not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,85 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .dispatch import dispatch
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size, lease_seconds=300):
+    """
+    Mark up to ``batch_size`` queued emails as SENDING and return them.
+
+    Rows are locked with SKIP LOCKED where the database supports it, so several
+    workers can drain the outbox at the same time. Rows stuck in SENDING for
+    longer than ``lease_seconds`` (the worker died mid-batch) are picked up again,
+    and failed ones only once their ``next_attempt_at`` has come.
+    """
+    now = timezone.now()
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    with transaction.atomic():
+        ids = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(state="PENDING") & due | Q(state="SENDING", claimed_at__lt=now - timedelta(seconds=lease_seconds)))
+            .order_by("created_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        EmailOutbox.objects.filter(id__in=ids).update(state="SENDING", claimed_at=now, attempts=F("attempts") + 1)
+    return list(EmailOutbox.objects.filter(id__in=ids).select_related("application__applicant", "application__interviewer"))
+
+
+def permanently_failed(item):
+    """Whether the last attempt ended in a permanent SMTP error, which retrying will not fix."""
+    return item.application.failed_emails.filter(kind=item.kind, resolved=False, permanent=True).exists()
+
+
+def retry_delay(attempts, base_delay=60, max_delay=3600):
+    """Seconds to wait after the ``attempts``-th failed attempt, doubling each time."""
+    return min(max_delay, base_delay * 2 ** (attempts - 1))
+
+
+def deliver(item, max_attempts=5, base_delay=60):
+    """Send one claimed email and record the outcome; returns its new state."""
+    try:
+        state = item.deliver()
+        error = None if state != "FAILED" else "send failed"
+    except Exception as e:
+        logger.exception("sending %s failed", item)
+        state, error = "FAILED", str(e)
+    if state == "FAILED" and item.attempts < max_attempts and not permanently_failed(item):
+        state = "PENDING"
+    EmailOutbox.objects.filter(id=item.id).update(
+        state=state,
+        last_error=error,
+        next_attempt_at=timezone.now() + timedelta(seconds=retry_delay(item.attempts, base_delay))
+        if state == "PENDING" else None,
+        sent_at=timezone.now() if state == "SENT" else None,
+        modified_at=timezone.now(),
+    )
+    return state
+
+
+def drain_batch(batch_size=50, max_attempts=5, lease_seconds=300, base_delay=60, max_workers=1):
+    """
+    Deliver one batch from the outbox with ``max_workers`` senders; returns a ``{state: count}`` summary.
+
+    A failed email is queued again after ``retry_delay``, so a server that is
+    down is not sent the same message again on the very next pass.
+    """
+    summary = {}
+    lock = threading.Lock()
+
+    def send(item):
+        state = deliver(item, max_attempts, base_delay)
+        with lock:
+            summary[state] = summary.get(state, 0) + 1
+        return state == "SENT"
+
+    dispatch(claim_batch(batch_size, lease_seconds), send, max_workers)
+    return summary
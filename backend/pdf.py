@@ -0,0 +1,84 @@
+"""
+Reading submitted PDFs. This runs in the worker processes of
+process_writing_tasks and imports nothing from Django, so a fresh worker
+process can load it without setting Django up.
+
+PyMuPDF (in requirements.txt) gives the page count, the text and
+a thumbnail of the first page. Where it cannot be installed, pypdf gives the
+page count and the text; without either, only the structure of the file is
+checked and the pages are counted from its page objects.
+"""
+import re
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+THUMBNAIL_WIDTH = 240
+# enough to search a writing task by, without storing whole books
+MAX_TEXT = 100_000
+
+PAGE_OBJECT = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+class InvalidPDF(ValueError):
+    pass
+
+
+def analyse(path):
+    """``{"pages", "text", "thumbnail"}`` for the PDF at ``path``; raises InvalidPDF if it cannot be read."""
+    try:
+        if pymupdf is not None:
+            return _analyse_pymupdf(path)
+        if pypdf is not None:
+            return _analyse_pypdf(path)
+        return _analyse_structure(path)
+    except InvalidPDF:
+        raise
+    except Exception as e:
+        raise InvalidPDF(f"{type(e).__name__}: {e}") from None
+
+
+def _analyse_pymupdf(path):
+    with pymupdf.open(path) as document:
+        if document.page_count == 0:
+            raise InvalidPDF("no pages")
+        text = []
+        for page in document:
+            text.append(page.get_text())
+            if sum(map(len, text)) > MAX_TEXT:
+                break
+        first = document[0]
+        zoom = THUMBNAIL_WIDTH / first.rect.width
+        thumbnail = first.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom)).tobytes("png")
+        return {"pages": document.page_count, "text": "".join(text)[:MAX_TEXT], "thumbnail": thumbnail}
+
+
+def _analyse_pypdf(path):
+    reader = pypdf.PdfReader(path)
+    if len(reader.pages) == 0:
+        raise InvalidPDF("no pages")
+    text = []
+    for page in reader.pages:
+        text.append(page.extract_text() or "")
+        if sum(map(len, text)) > MAX_TEXT:
+            break
+    return {"pages": len(reader.pages), "text": "".join(text)[:MAX_TEXT], "thumbnail": None}
+
+
+def _analyse_structure(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(b"%PDF-"):
+        raise InvalidPDF("missing %PDF- header")
+    if b"%%EOF" not in data[-1024:]:
+        raise InvalidPDF("missing %%EOF, the file is truncated")
+    # page objects inside compressed object streams cannot be seen this way
+    pages = len(PAGE_OBJECT.findall(data)) or None
+    return {"pages": pages, "text": "", "thumbnail": None}
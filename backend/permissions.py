@@ -0,0 +1,23 @@
+from django.db.models import Q
+
+DEPARTMENT_GROUPS = ("LAW", "IT", "LIA", "FIN", "PR", "HR", "CM", "TUT")
+
+
+def department_scope(user, queryset, *fields):
+    """
+    The part of ``queryset`` ``user`` may see: everything for superusers and
+    the ALL group, otherwise the rows whose ``fields`` hold one of the
+    departments the user is a group member of.
+    """
+    if user.is_superuser:
+        return queryset
+    query = Q()
+    for g in user.groups.all():
+        if g.name in DEPARTMENT_GROUPS:
+            for field in fields:
+                query.add(Q(**{field: g.name}), Q.OR)
+        elif g.name == "ALL":
+            return queryset
+    if len(query) == 0:
+        return queryset.none()
+    return queryset.filter(query)
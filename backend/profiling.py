@@ -0,0 +1,138 @@
+import cProfile
+import io
+import logging
+import pstats
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised instead of logging when REQUEST_PROFILING["RAISE"] is on, so tests fail on a regression."""
+
+
+class QueryRecorder:
+    """Counts and times every query run on the wrapped connections, without needing DEBUG."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        """``{sql: times}`` for statements run more than once, the usual sign of a lookup per row."""
+        return {sql: times for sql, times in self.statements.items() if times > 1}
+
+    def record(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+def budget_for(view_name):
+    config = getattr(settings, "REQUEST_PROFILING", {})
+    budget = {key: config.get(key) for key in ("MAX_QUERIES", "MAX_DUPLICATES", "MAX_MS")}
+    budget.update(config.get("BUDGETS", {}).get(view_name, {}))
+    return budget
+
+
+class ProfilingMiddleware:
+    """
+    Records wall time, SQL query count and time, and repeated queries for
+    each request, and logs the requests over their budget: MAX_QUERIES,
+    MAX_DUPLICATES and MAX_MS from REQUEST_PROFILING, overridden per view
+    name in BUDGETS.
+
+    One request in SAMPLE_EVERY also runs under cProfile, and its slowest
+    functions are logged. Requests served by an async middleware chain are
+    checked against their budgets but never sampled, as cProfile would also
+    see every other coroutine the event loop runs meanwhile. Their queries
+    are recorded in the thread their ORM calls run in, as in MetricsMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = getattr(settings, "REQUEST_PROFILING", {})
+        if not config.get("ENABLED"):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_every = config.get("SAMPLE_EVERY", 0)
+        self.raise_errors = config.get("RAISE", False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile() if self.sample_every and random.randrange(self.sample_every) == 0 else None
+        start = time.perf_counter()
+        with recorder.record():
+            if profiler:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        self.report(request, recorder, time.perf_counter() - start, profiler)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        recording = await sync_to_async(recorder.record)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.close)()
+        self.report(request, recorder, time.perf_counter() - start)
+        return response
+
+    def report(self, request, recorder, elapsed, profiler=None):
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else request.path
+        problems = self.check(view_name, recorder, elapsed)
+        if problems:
+            summary = self.summary(request, view_name, recorder, elapsed)
+            if self.raise_errors:
+                raise QueryBudgetExceeded(f"{summary}: {', '.join(problems)}")
+            logger.warning("%s: %s", summary, ", ".join(problems))
+        if profiler:
+            stats = io.StringIO()
+            pstats.Stats(profiler, stream=stats).sort_stats("cumulative").print_stats(20)
+            logger.info("profile of %s\n%s", self.summary(request, view_name, recorder, elapsed), stats.getvalue())
+
+    def check(self, view_name, recorder, elapsed):
+        budget = budget_for(view_name)
+        problems = []
+        if budget["MAX_QUERIES"] is not None and recorder.count > budget["MAX_QUERIES"]:
+            problems.append(f"{recorder.count} queries, budget {budget['MAX_QUERIES']}")
+        if budget["MAX_MS"] is not None and elapsed * 1000 > budget["MAX_MS"]:
+            problems.append(f"{elapsed * 1000:.0f} ms, budget {budget['MAX_MS']} ms")
+        duplicates = recorder.duplicates()
+        repeated = sum(times - 1 for times in duplicates.values())
+        if budget["MAX_DUPLICATES"] is not None and repeated > budget["MAX_DUPLICATES"]:
+            sql, times = max(duplicates.items(), key=lambda item: item[1])
+            problems.append(f"{repeated} repeated queries, budget {budget['MAX_DUPLICATES']}, e.g. {times}x {sql[:200]}")
+        return problems
+
+    def summary(self, request, view_name, recorder, elapsed):
+        return (f"{request.method} {request.path} ({view_name}) {elapsed * 1000:.0f} ms, "
+                f"{recorder.count} queries in {recorder.time * 1000:.0f} ms")
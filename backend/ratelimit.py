@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+
+
+class TokenBucket(ABC):
+    """
+    A token bucket refilled at ``rate`` tokens per second, holding at most ``burst``.
+
+    ``try_acquire`` never blocks: it returns 0 when the tokens were taken, or
+    the number of seconds to wait before trying again. ``acquire`` blocks until
+    the tokens are available, which gives callers backpressure instead of errors.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+
+    def _refill(self, tokens, updated_at, now):
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    @abstractmethod
+    def try_acquire(self, key, tokens=1):
+        """Take ``tokens`` now if there are enough; returns 0, or the seconds to wait before trying again."""
+
+    def acquire(self, key, tokens=1, timeout=None):
+        """Wait until ``tokens`` can be taken; returns False if ``timeout`` seconds pass first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(key, tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def atry_acquire(self, key, tokens=1):
+        return await sync_to_async(self.try_acquire)(key, tokens)
+
+    async def aacquire(self, key, tokens=1, timeout=None):
+        """``acquire`` for async code: waits with ``asyncio.sleep`` instead of blocking the loop."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = await self.atry_acquire(key, tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+class LocalTokenBucket(TokenBucket):
+    """Buckets kept in this process, shared by all of its threads."""
+
+    def __init__(self, rate, burst):
+        super().__init__(rate, burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, key, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            available, updated_at = self._buckets.get(key, (self.burst, now))
+            available = self._refill(available, updated_at, now)
+            if available < tokens:
+                self._buckets[key] = (available, now)
+                return (tokens - available) / self.rate
+            self._buckets[key] = (available - tokens, now)
+            return 0
+
+    async def atry_acquire(self, key, tokens=1):
+        # only holds a lock for a few arithmetic operations, no need for a thread
+        return self.try_acquire(key, tokens)
+
+
+class DatabaseTokenBucket(TokenBucket):
+    """
+    Buckets stored in the RateLimitBucket table, shared by every process using the database.
+
+    Each update is a compare-and-swap on the row version, so concurrent takers
+    never spend the same tokens twice and no row locks are held while waiting.
+    """
+
+    def try_acquire(self, key, tokens=1):
+        from .models import RateLimitBucket
+
+        for _ in range(10):
+            now = time.time()
+            row = RateLimitBucket.objects.filter(key=key).values_list("tokens", "updated_at", "version").first()
+            if row is None:
+                try:
+                    with transaction.atomic():
+                        RateLimitBucket.objects.create(key=key, tokens=self.burst - tokens, updated_at=now)
+                    return 0
+                except IntegrityError:
+                    continue  # another process created the bucket first
+            available, updated_at, version = row
+            available = self._refill(available, updated_at, now)
+            if available < tokens:
+                return (tokens - available) / self.rate
+            if RateLimitBucket.objects.filter(key=key, version=version).update(
+                    tokens=available - tokens, updated_at=now, version=version + 1):
+                return 0
+        # lost the race every time, back off briefly
+        return tokens / self.rate
+
+
+BACKENDS = {
+    "local": LocalTokenBucket,
+    "database": DatabaseTokenBucket,
+}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(rate, burst, backend="local"):
+    """Return the process-wide bucket for these settings, so every caller shares its state."""
+    with _buckets_lock:
+        bucket = _buckets.get((backend, rate, burst))
+        if bucket is None:
+            bucket = _buckets[(backend, rate, burst)] = BACKENDS[backend](rate, burst)
+        return bucket
+
+
+def reset_token_buckets():
+    """Forget every process-wide bucket, so the next caller starts with full buckets (used by tests)."""
+    with _buckets_lock:
+        _buckets.clear()
@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import Applicant, ApplicationStatus
-from django.db.models import Q
+from .models import Applicant, ApplicationStatus, UploadSession
+from .uploads import MAX_WRITING_TASK_SIZE
+from django.db.models import FilteredRelation, OuterRef, Q, Subquery
+
+WRITING_TASK_STATUSES = ["NEW_APPLICATION", "WRTIING_TASK_EMAIL_SENT", "WRTIING_TASK_SUBMITTED"]
 
 
 class CreateApplicantSerializer(serializers.ModelSerializer):
@@ -25,10 +28,103 @@ class WritingTaskSerializer(serializers.ModelSerializer):
     
     def get_applications(self, applicant):
         
-        queryset = applicant.applications.filter(Q(status="NEW_APPLICATION") | Q(status="WRTIING_TASK_EMAIL_SENT") | Q(status="WRTIING_TASK_SUBMITTED"))
+        queryset = applicant.applications.filter(status__in=WRITING_TASK_STATUSES)
         serializer = WritingTaskStatusSerializer(queryset, many=True)
         return serializer.data
     
     class Meta:
         model = Applicant
-        fields = ["name", "applications"]
\ No newline at end of file
+        fields = ["name", "applications"]
+
+
+
+class CreateUploadSessionSerializer(serializers.ModelSerializer):
+    handle_by = serializers.CharField(write_only=True)
+    size = serializers.IntegerField(min_value=1, max_value=MAX_WRITING_TASK_SIZE)
+
+    class Meta:
+        model = UploadSession
+        fields = ["id", "handle_by", "file_name", "size", "received"]
+        read_only_fields = ["id", "received"]
+
+    def validate_file_name(self, value):
+        if not value.lower().endswith(".pdf"):
+            raise serializers.ValidationError("File type not supported")
+        return value
+
+
+_ddl_field = serializers.DateTimeField()
+_file_storage = ApplicationStatus._meta.get_field("writing_task_file").storage
+
+
+def writing_task_data(pk):
+    """
+    ``(data, last_modified)`` for applicant ``pk``, or None if there is no such applicant.
+
+    ``data`` is what ``WritingTaskSerializer`` returns. The applicant and its
+    writing-task applications come from a single LEFT JOIN on a FilteredRelation,
+    and the rows are formatted directly instead of going through a nested
+    serializer per application. ``last_modified`` covers the applicant and all of
+    its applications, so it still moves when one leaves the writing-task statuses.
+    """
+    return _writing_task_result(list(_writing_task_rows(pk)))
+
+
+async def awriting_task_data(pk):
+    """``writing_task_data`` with the async ORM."""
+    return _writing_task_result([row async for row in _writing_task_rows(pk)])
+
+
+def writing_task_version(pk):
+    """The ``last_modified`` of ``writing_task_data(pk)``, from one indexed query; None if there is no such applicant."""
+    return _writing_task_version(_writing_task_version_rows(pk).first())
+
+
+async def awriting_task_version(pk):
+    return _writing_task_version(await _writing_task_version_rows(pk).afirst())
+
+
+def _writing_task_version_rows(pk):
+    latest_application = ApplicationStatus.objects.filter(applicant=OuterRef("pk"))\
+        .order_by("-modified_at").values("modified_at")[:1]
+    return Applicant.objects.filter(pk=pk).order_by()\
+        .annotate(latest_application=Subquery(latest_application)).values_list("modified_at", "latest_application")
+
+
+def _writing_task_version(row):
+    if row is None:
+        return None
+    modified_at, latest_application = row
+    return max(modified_at, latest_application or modified_at)
+
+
+def _writing_task_rows(pk):
+    latest_application = ApplicationStatus.objects.filter(applicant=OuterRef("pk"))\
+        .order_by("-modified_at").values("modified_at")[:1]
+    return (
+        Applicant.objects.filter(pk=pk)
+        .annotate(tasks=FilteredRelation("applications", condition=Q(applications__status__in=WRITING_TASK_STATUSES)),
+                  latest_application=Subquery(latest_application))
+        .order_by("tasks__handle_by", "tasks__status", "tasks__created_at")
+        .values_list("name", "modified_at", "latest_application", "tasks__handle_by", "tasks__writing_task_ddl",
+                     "tasks__writing_task_file", "tasks__writing_task_video_link")
+    )
+
+
+def _writing_task_result(rows):
+    if not rows:
+        return None
+    name, modified_at, latest_application = rows[0][:3]
+    data = {
+        "name": name,
+        "applications": [
+            {
+                "handle_by": handle_by,
+                "writing_task_ddl": _ddl_field.to_representation(ddl) if ddl else None,
+                "writing_task_file": _file_storage.url(file) if file else None,
+                "writing_task_video_link": video_link,
+            }
+            for _, _, _, handle_by, ddl, file, video_link in rows if handle_by is not None
+        ],
+    }
+    return data, max(modified_at, latest_application or modified_at)
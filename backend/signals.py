@@ -1,9 +1,55 @@
+from django.db.backends.signals import connection_created
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import InterviewScore
+from .caching import invalidate_writing_task
+from .models import Applicant, ApplicationStatus, InterviewScore
 
 @receiver(post_save, sender=InterviewScore)
+def add_application_score(sender, instance, created, **kwargs):
+    saved = instance._saved_score
+    if created:
+        ApplicationStatus.adjust_interview_scores(instance.application_id, instance.score, 1)
+    elif saved is None:
+        # saved without being read first, so the score it replaced is unknown
+        totals = ApplicationStatus.interview_score_totals(application=instance.application_id)
+        ApplicationStatus.set_interview_scores(instance.application_id, *totals.get(instance.application_id, (0.0, 0)))
+    elif saved[0] != instance.application_id:
+        ApplicationStatus.adjust_interview_scores(saved[0], -saved[1], -1)
+        ApplicationStatus.adjust_interview_scores(instance.application_id, instance.score, 1)
+    elif saved[1] != instance.score:
+        ApplicationStatus.adjust_interview_scores(instance.application_id, instance.score - saved[1], 0)
+    instance._saved_score = (instance.application_id, instance.score)
+
+
 @receiver(post_delete, sender=InterviewScore)
-def update_application_score(sender, instance, **kwargs):
-    instance.application.update_avgInterviewScore()
-    instance.application.save()
\ No newline at end of file
+def remove_application_score(sender, instance, **kwargs):
+    application_id, score = instance._saved_score or (instance.application_id, instance.score)
+    ApplicationStatus.adjust_interview_scores(application_id, -score, -1)
+
+
+@receiver(post_save, sender=ApplicationStatus)
+@receiver(post_delete, sender=ApplicationStatus)
+def invalidate_application_writing_task(sender, instance, **kwargs):
+    invalidate_writing_task(instance.applicant_id)
+
+
+@receiver(post_delete, sender=ApplicationStatus)
+def release_application_writing_task_file(sender, instance, **kwargs):
+    # the storage counts references, so the file goes only if no other application uses it
+    if instance.writing_task_file:
+        instance.writing_task_file.delete(save=False)
+
+
+@receiver(post_save, sender=Applicant)
+@receiver(post_delete, sender=Applicant)
+def invalidate_applicant_writing_task(sender, instance, **kwargs):
+    invalidate_writing_task(instance.pk)
+
+
+@receiver(connection_created)
+def enable_sqlite_wal(sender, connection, **kwargs):
+    # in WAL mode readers do not block writers, so bulk email threads can save
+    # applications while the admin action is still streaming the queryset
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode=WAL")
@@ -0,0 +1,149 @@
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics
+
+
+class SMTPConnectionPool:
+    """
+    A thread-safe pool of logged-in SMTP connections for a single sender account.
+
+    Opening a connection to the Feishu server costs a TCP handshake, STARTTLS and
+    AUTH, which dominates the time of sending one message. The pool keeps up to
+    ``max_size`` connections open and hands them out again:
+
+    - connections idle for longer than ``idle_timeout`` seconds are closed
+    - connections idle for longer than ``check_interval`` seconds are checked
+      with NOOP before they are reused
+    - connections are recycled after ``max_messages`` messages
+    - if a reused connection turns out to be dead while sending, the message is
+      retried once on a fresh connection
+
+    With ``pooling=False`` every connection is closed after use, which gives the
+    old connect-send-quit behaviour.
+    """
+
+    def __init__(self, host, port, username, password, *, max_size=4, idle_timeout=60,
+                 check_interval=10, max_messages=100, timeout=30, starttls=True, pooling=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.starttls = starttls
+        self.pooling = pooling
+
+        self._idle = []  # (connection, last_used, messages_sent), most recently used last
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        # connecting through the constructor makes STARTTLS check the certificate against
+        # the host name; the "connect" span therefore includes the DNS lookup
+        with metrics.span("connect"):
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                with metrics.span("starttls"):
+                    conn.starttls(context=ssl.create_default_context())
+            if self.username:
+                with metrics.span("auth"):
+                    conn.login(self.username, self.password)
+        except BaseException:
+            self._close(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def _close(conn, quit=False):
+        try:
+            if quit:
+                conn.quit()
+            else:
+                conn.close()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        """Return ``(connection, messages_sent, reused)``, opening a new connection if no idle one is usable."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used, sent = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout:
+                self._close(conn, quit=True)
+            elif idle_for > self.check_interval and not self._is_alive(conn):
+                self._close(conn)
+            else:
+                return conn, sent, True
+        return self._connect(), 0, False
+
+    def _checkin(self, conn, sent):
+        if not self.pooling or sent >= self.max_messages:
+            self._close(conn, quit=True)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic(), sent))
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it is returned to the pool unless the block raises."""
+        with self._slots:
+            conn, sent, _ = self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                self._close(conn)
+                raise
+            self._checkin(conn, sent + 1)
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Same contract as ``smtplib.SMTP.sendmail``, on a pooled connection."""
+        with self._slots:
+            conn, sent, reused = self._checkout()
+            try:
+                with metrics.span("data"):
+                    errs = conn.sendmail(from_addr, to_addrs, msg)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._close(conn)
+                if not reused:
+                    raise
+                # the server dropped an idle connection, try once more on a new one
+                conn, sent = self._connect(), 0
+                try:
+                    with metrics.span("data"):
+                        errs = conn.sendmail(from_addr, to_addrs, msg)
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    self._close(conn)
+                    raise
+                except smtplib.SMTPException:
+                    self._checkin(conn, sent + 1)
+                    raise
+            except smtplib.SMTPException:
+                # refusals leave the session reset by smtplib, the connection is still usable
+                self._checkin(conn, sent + 1)
+                raise
+            self._checkin(conn, sent + 1)
+            return errs
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._close(conn, quit=True)
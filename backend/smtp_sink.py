@@ -0,0 +1,176 @@
+import asyncio
+import base64
+import random
+import threading
+
+
+class SMTPSink:
+    """
+    A local stand-in for smtp.feishu.cn that accepts and stores every message.
+
+    The server runs an asyncio loop in a daemon thread so it can be used from
+    both blocking (smtplib) and async clients. It advertises PIPELINING and
+    AUTH PLAIN/LOGIN, accepts any credentials and never offers STARTTLS, so
+    clients must be configured with STARTTLS disabled.
+
+    Faults can be injected to load-test the mail pipeline:
+
+    - ``handshake_latency`` delays the greeting and the AUTH reply to imitate
+      the TCP + TLS + AUTH cost of opening a real connection
+    - ``latency`` delays the reply to every message (after DATA)
+    - ``error_rate`` answers that share of messages with 451 (transient)
+    - ``permanent_error_rate`` refuses that share of recipients with 550
+    - ``drop_rate`` closes the connection instead of answering that share of messages
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, handshake_latency=0.0, latency=0.0,
+                 error_rate=0.0, permanent_error_rate=0.0, drop_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.handshake_latency = handshake_latency
+        self.latency = latency
+        self.error_rate = error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.drop_rate = drop_rate
+        self._random = random.Random(seed)
+        self.messages = []
+        self.rejected = 0
+        self.dropped = 0
+        self.connections = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="smtp-sink", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.host, self.port
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _reply(self, writer, line):
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.handshake_latency:
+                await asyncio.sleep(self.handshake_latency)
+            await self._reply(writer, "220 saga-sink ESMTP")
+            await self._session(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # the client went away, or the sink is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def _session(self, reader, writer):
+        mail_from, rcpt_tos = None, []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            command, _, arg = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            command = command.upper()
+            if command == "EHLO":
+                await self._reply(writer, "250-saga-sink\r\n250-PIPELINING\r\n250-8BITMIME\r\n250 AUTH PLAIN LOGIN")
+            elif command == "HELO":
+                await self._reply(writer, "250 saga-sink")
+            elif command == "AUTH":
+                await self._auth(reader, writer, arg)
+            elif command == "MAIL":
+                mail_from, rcpt_tos = arg, []
+                await self._reply(writer, "250 OK")
+            elif command == "RCPT":
+                if self.permanent_error_rate and self._random.random() < self.permanent_error_rate:
+                    self.rejected += 1
+                    await self._reply(writer, "550 Mailbox unavailable")
+                    continue
+                rcpt_tos.append(arg)
+                await self._reply(writer, "250 OK")
+            elif command == "DATA":
+                if not rcpt_tos:
+                    await self._reply(writer, "554 No valid recipients")
+                    continue
+                await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                data = await self._read_data(reader)
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                fault = self._random.random() if self.drop_rate or self.error_rate else 1.0
+                if fault < self.drop_rate:
+                    self.dropped += 1
+                    return
+                if fault < self.drop_rate + self.error_rate:
+                    self.rejected += 1
+                    await self._reply(writer, "451 Temporary failure, try again later")
+                else:
+                    self.messages.append((mail_from, rcpt_tos, data))
+                    await self._reply(writer, "250 OK queued")
+                mail_from, rcpt_tos = None, []
+            elif command == "RSET":
+                mail_from, rcpt_tos = None, []
+                await self._reply(writer, "250 OK")
+            elif command == "NOOP":
+                await self._reply(writer, "250 OK")
+            elif command == "QUIT":
+                await self._reply(writer, "221 Bye")
+                return
+            else:
+                await self._reply(writer, "502 Command not implemented")
+
+    async def _auth(self, reader, writer, arg):
+        mechanism, _, initial = arg.partition(" ")
+        if mechanism.upper() == "LOGIN":
+            for prompt in (b"Username:", b"Password:"):
+                await self._reply(writer, "334 " + base64.b64encode(prompt).decode())
+                await reader.readline()
+        elif not initial:
+            await self._reply(writer, "334 ")
+            await reader.readline()
+        if self.handshake_latency:
+            await asyncio.sleep(self.handshake_latency)
+        await self._reply(writer, "235 Authentication successful")
+
+    async def _read_data(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("connection closed during DATA")
+            if line in (b".\r\n", b".\n"):
+                return b"".join(lines)
+            if line.startswith(b".."):
+                line = line[1:]
+            lines.append(line)
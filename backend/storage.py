@@ -0,0 +1,98 @@
+import hashlib
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .uploads import CHUNK_SIZE
+
+
+def content_sha256(content):
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file once, named by the SHA-256 of its content and sharded
+    by its first bytes: ``<prefix>/ab/cd/<sha256><ext>``.
+
+    Saving content that is already stored only takes another reference to
+    it, and ``delete()`` drops one; the file itself is removed with the last
+    reference. References are counted in the FileBlob table. Names outside
+    the layout (files saved before it) are deleted directly.
+
+    Uploads that carry a ``sha256`` attribute (see uploads.StreamedUploadedFile)
+    are not hashed again.
+    """
+
+    def __init__(self, prefix="writing_task", **kwargs):
+        # a name is only ever written with the content it is the hash of, so
+        # two uploads racing to store it may both write
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+        self.prefix = prefix
+
+    def blob_name(self, sha256, ext=""):
+        return f"{self.prefix}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext.lower()}"
+
+    def is_blob(self, name):
+        parts = name.split("/")
+        return (len(parts) == 4 and parts[0] == self.prefix and len(parts[3]) >= 64
+                and parts[3][:64].startswith(parts[1] + parts[2]))
+
+    def get_available_name(self, name, max_length=None):
+        # the same name is the same content, there is never a clash to avoid
+        return name
+
+    def _save(self, name, content):
+        from .models import FileBlob
+
+        sha256 = getattr(content, "sha256", None) or content_sha256(content)
+        name = self.blob_name(sha256, os.path.splitext(name)[1])
+        with transaction.atomic():
+            # the row lock serialises references to this blob with a concurrent last delete()
+            blob = FileBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None or not self.exists(name):
+                name = super()._save(name, content)
+            if blob is None:
+                FileBlob.objects.create(name=name, sha256=sha256, size=content.size, refcount=1)
+            else:
+                FileBlob.objects.filter(pk=blob.pk).update(refcount=F("refcount") + 1)
+        return name
+
+    def delete(self, name):
+        from .models import FileBlob
+
+        if not name or not self.is_blob(name):
+            return super().delete(name)
+        with transaction.atomic():
+            FileBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F("refcount") - 1)
+            if FileBlob.objects.filter(name=name, refcount=0).delete()[0]:
+                # removed once the deletion commits, so a rollback never loses a referenced file
+                transaction.on_commit(lambda: self.purge(name))
+
+    def purge(self, name):
+        from .models import FileBlob
+
+        if not FileBlob.objects.filter(name=name).exists():
+            super().delete(name)
+            super().delete(self.thumbnail_name(name))
+
+    def thumbnail_name(self, name):
+        return f"{name}.thumb.png"
+
+    def save_thumbnail(self, name, png):
+        """Store the thumbnail of ``name``, replacing any earlier one; thumbnails are not reference counted."""
+        return super()._save(self.thumbnail_name(name), ContentFile(png))
+
+
+writing_task_storage = ContentAddressedStorage()
@@ -1,3 +1,1096 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import smtplib
+import socket
+import ssl
+import tempfile
+import uuid
+import zipfile
+from datetime import timedelta
+from types import ModuleType
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import async_views, metrics
+from .async_smtp import AsyncSMTPConnection, AsyncSMTPConnectionPool
+from .caching import invalidate_writing_task
+from .dispatch import dispatch
+from .media import stream_zip
+from .documents import pdf_executor, process_batch
+from .management.commands.replay_traffic import REPLAY_SRC
+from .email import (aclose_smtp_pools, asend_email_with_no_reply, classify_smtp_error, close_smtp_pools,
+                    compose_interview_email, get_smtp_pool, recipient_hash, send_email_with_no_reply)
+from .email_optimize import html_to_text, optimize_html
+from .email_templates import CompiledTemplate
+from .models import (DEPARTMENTS, Applicant, ApplicationStatus, EmailOutbox, EmailSendLog, FailedEmail, FileBlob,
+                     InterviewScore, UploadSession)
+from .monitoring import STATUS_COUNTS_KEY, MetricsMiddleware
+from .outbox import drain_batch
+from .profiling import QueryBudgetExceeded
+from .ratelimit import DatabaseTokenBucket, LocalTokenBucket, reset_token_buckets
+from .serializers import WritingTaskSerializer
+from .smtp_pool import SMTPConnectionPool
+from .smtp_sink import SMTPSink
+from .throttling import get_concurrency_limit
+from .urls import build_urlpatterns
+
+
+# the applicant throttles are process-wide, so with them on every test posting APPLICANT_DATA
+# would draw on the same buckets; ApplicantThrottleTests turns them on for itself
+_applicant_throttles_off = override_settings(APPLICANT_THROTTLES={})
+
+
+def setUpModule():
+    _applicant_throttles_off.enable()
+
+
+def tearDownModule():
+    _applicant_throttles_off.disable()
+
+
+@override_settings(EMAIL_SEND_LOG=False)
+class SMTPConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+
+    def make_pool(self, **kwargs):
+        pool = SMTPConnectionPool(self.sink.host, self.sink.port, "user", "secret", starttls=False, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connection_is_reused(self):
+        pool = self.make_pool()
+        for i in range(5):
+            pool.sendmail("no-reply@saga-xingguang.com", f"a{i}@example.com", "Subject: hi\r\n\r\nbody")
+        self.assertEqual(len(self.sink.messages), 5)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_without_pooling_every_message_connects(self):
+        pool = self.make_pool(pooling=False)
+        for i in range(3):
+            pool.sendmail("no-reply@saga-xingguang.com", f"a{i}@example.com", "Subject: hi\r\n\r\nbody")
+        self.assertEqual(self.sink.connections, 3)
+
+    def test_dead_connection_is_replaced_transparently(self):
+        pool = self.make_pool(check_interval=3600)
+        pool.sendmail("no-reply@saga-xingguang.com", "a@example.com", "Subject: hi\r\n\r\nbody")
+        conn, _, _ = pool._idle[0]
+        conn.sock.shutdown(socket.SHUT_RDWR)
+        pool.sendmail("no-reply@saga-xingguang.com", "b@example.com", "Subject: hi\r\n\r\nbody")
+        self.assertEqual(len(self.sink.messages), 2)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_idle_connection_is_closed_after_timeout(self):
+        pool = self.make_pool(idle_timeout=0)
+        pool.sendmail("no-reply@saga-xingguang.com", "a@example.com", "Subject: hi\r\n\r\nbody")
+        pool.sendmail("no-reply@saga-xingguang.com", "b@example.com", "Subject: hi\r\n\r\nbody")
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_send_helpers_share_the_sender_pool(self):
+        with override_settings(EMAIL_SMTP_HOST=self.sink.host, EMAIL_SMTP_PORT=self.sink.port,
+                               EMAIL_SMTP_STARTTLS=False, EMAIL_RATE_LIMITS={}):
+            close_smtp_pools()
+            self.addCleanup(close_smtp_pools)
+            self.assertTrue(send_email_with_no_reply("a@example.com", "", "<p>hi</p>"))
+            self.assertTrue(send_email_with_no_reply("b@example.com", "", "<p>hi</p>"))
+            self.assertIs(get_smtp_pool("no-reply@saga-xingguang.com"), get_smtp_pool("no-reply@saga-xingguang.com"))
+        self.assertEqual(self.sink.connections, 1)
+
+
+@override_settings(EMAIL_SEND_LOG=False)
+class AsyncSMTPTests(SimpleTestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+
+    async def test_connection_sends_with_pipelining(self):
+        conn = AsyncSMTPConnection(self.sink.host, self.sink.port, "user", "secret", starttls=False)
+        await conn.connect()
+        self.assertIn("PIPELINING", conn.extensions)
+        self.assertEqual(await conn.sendmail("no-reply@saga-xingguang.com", "a@example.com", "Subject: hi\n\n.dot\n"), {})
+        await conn.quit()
+        self.assertEqual(self.sink.messages, [("FROM:<no-reply@saga-xingguang.com>", ["TO:<a@example.com>"], b"Subject: hi\r\n\r\n.dot\r\n")])
+
+    async def test_pool_spreads_messages_over_few_connections(self):
+        pool = AsyncSMTPConnectionPool(self.sink.host, self.sink.port, "user", "secret", starttls=False, max_size=2)
+        await asyncio.gather(*[
+            pool.sendmail("no-reply@saga-xingguang.com", f"a{i}@example.com", "Subject: hi\r\n\r\nbody")
+            for i in range(20)
+        ])
+        await pool.close()
+        self.assertEqual(len(self.sink.messages), 20)
+        self.assertEqual(self.sink.connections, 2)
+
+    async def test_async_send_helper(self):
+        with override_settings(EMAIL_SMTP_HOST=self.sink.host, EMAIL_SMTP_PORT=self.sink.port,
+                               EMAIL_SMTP_STARTTLS=False, EMAIL_RATE_LIMITS={}):
+            self.assertTrue(await asend_email_with_no_reply("a@example.com", "", "<p>hi</p>"))
+            self.assertTrue(await asend_email_with_no_reply("b@example.com", "", "<p>hi</p>"))
+            await aclose_smtp_pools()
+        self.assertEqual(len(self.sink.messages), 2)
+        self.assertEqual(self.sink.connections, 1)
+
+
+class EmailTemplateTests(SimpleTestCase):
+    def test_bind_merges_static_fields(self):
+        template = CompiledTemplate.compile("<p>{{ name }} - {{ dept_name }}</p>").bind(dept_name="IT部")
+        self.assertEqual(template.fields, ("name",))
+        self.assertEqual(template.render(name="<b>张三</b>"), "<p>&lt;b&gt;张三&lt;/b&gt; - IT部</p>")
+
+    def test_interview_email_renders_department(self):
+        content = compose_interview_email(1, "张三", "IT", "2024-07-01 10:00", "https://meeting.example.com")
+        self.assertIn("志行会SAGA星光项目组·IT部敬上", content)
+        self.assertNotIn("{{", content)
+        self.assertIn("会议链接：https://meeting.example.com", content.text)
+
+    def test_optimize_drops_unused_css_and_keeps_placeholders(self):
+        source = """<html><head><style>
+            /* comment */
+            p { color: red; }
+            .unused, .main a { margin: 0; }
+            .ExternalClass { width: 100%; }
+            </style></head>
+            <body>  <p class="main">  {{ name }} <a href="x">link</a></p>  </body></html>"""
+        self.assertEqual(optimize_html(source),
+                         '<html><head><style>p{color:red}.main a{margin:0}.ExternalClass{width:100%}</style></head>'
+                         '<body><p class="main">{{ name }} <a href="x">link</a></p></body></html>')
+
+    def test_text_part_writes_out_links(self):
+        text = html_to_text('<html><head><title>t</title></head><body><p>Hi {{ name }},</p>'
+                            '<ul><li>one</li><li><a href="https://a.example.com">site</a></li></ul></body></html>')
+        self.assertEqual(text, "Hi {{ name }},\n\n- one\n- site (https://a.example.com)\n")
+
+
+class DispatchTests(SimpleTestCase):
+    def send(self, item):
+        if item == 3:
+            raise ConnectionError("boom")
+        return item % 2 == 0
+
+    def test_failures_do_not_stop_other_items(self):
+        for max_workers in (1, 4):
+            with self.assertLogs("backend.dispatch", "ERROR") as logs:
+                self.assertEqual(dispatch(iter(range(10)), self.send, max_workers), (5, 5))
+            self.assertIn("dispatching 3 failed", logs.output[0])
+
+
+class LocalTokenBucketTests(SimpleTestCase):
+    def test_burst_then_wait(self):
+        bucket = LocalTokenBucket(rate=10, burst=3)
+        self.assertEqual([bucket.try_acquire("a") for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.try_acquire("a"), 0.1, places=2)
+        self.assertEqual(bucket.try_acquire("b"), 0)
+
+    def test_acquire_blocks_until_refilled(self):
+        bucket = LocalTokenBucket(rate=50, burst=1)
+        bucket.acquire("a")
+        self.assertTrue(bucket.acquire("a", timeout=1))
+        self.assertFalse(bucket.acquire("a", timeout=0))
+
+
+class ClassifySMTPErrorTests(SimpleTestCase):
+    def test_classification(self):
+        self.assertEqual(classify_smtp_error(smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"no such user")})), (True, 550))
+        self.assertEqual(classify_smtp_error(smtplib.SMTPDataError(451, b"try again later")), (False, 451))
+        self.assertEqual(classify_smtp_error(smtplib.SMTPServerDisconnected()), (False, None))
+        self.assertEqual(classify_smtp_error(ConnectionResetError()), (False, None))
+
+    def test_smtp_and_certificate_errors_are_permanent(self):
+        # all of these are OSErrors, but retrying them cannot help
+        for error in [smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server."),
+                      smtplib.SMTPException("No suitable authentication method found."),
+                      ssl.SSLCertVerificationError(1, "certificate verify failed")]:
+            with self.subTest(error=error):
+                self.assertEqual(classify_smtp_error(error), (True, None))
+        self.assertEqual(classify_smtp_error(TimeoutError()), (False, None))
+
+
+APPLICANT_DATA = {
+    "name": "张三", "email": "zhangsan@example.com", "phone": "13800000000",
+    "school": "某大学", "major": "数学", "grade": "UG2", "sex": "M", "wechat": "zhangsan",
+    "first_choice": "IT", "self_intro": "你好", "disposable_time": 3,
+}
+
+
+ASYNC_URLCONF = ModuleType("async_urlconf")
+ASYNC_URLCONF.urlpatterns = [path("api/v1/", include(build_urlpatterns(async_views)))]
+
+
+def create_application(status="NEW_APPLICATION", **fields):
+    applicant = Applicant.objects.create(**APPLICANT_DATA)
+    return ApplicationStatus.objects.create(applicant=applicant, handle_by=applicant.first_choice, status=status, **fields)
+
+
+class SinkTestMixin:
+    """Points every send_* helper at a local SMTP sink for the duration of a test."""
+
+    def setUp(self):
+        super().setUp()
+        self.sink = SMTPSink()
+        self.sink.start()
+        self.addCleanup(self.sink.stop)
+        settings_override = override_settings(EMAIL_SMTP_HOST=self.sink.host, EMAIL_SMTP_PORT=self.sink.port,
+                                              EMAIL_SMTP_STARTTLS=False, EMAIL_RETRY={"MAX_ATTEMPTS": 2, "BASE_DELAY": 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        close_smtp_pools()
+        self.addCleanup(close_smtp_pools)
+
+
+class EmailOutboxTests(SinkTestMixin, TestCase):
+    def test_applicant_create_queues_email_without_sending(self):
+        response = APIClient().post("/api/v1/applicants/", APPLICANT_DATA, format="json")
+        self.assertEqual(response.status_code, 201)
+        item = EmailOutbox.objects.get()
+        self.assertEqual(item.state, "PENDING")
+        self.assertEqual(item.application.status, "NEW_APPLICATION")
+        self.assertEqual(self.sink.messages, [])
+
+    def test_drain_sends_and_updates_status(self):
+        application = create_application()
+        EmailOutbox.objects.create(application=application)
+        self.assertEqual(drain_batch(), {"SENT": 1})
+        application.refresh_from_db()
+        self.assertEqual(application.status, "WRTIING_TASK_EMAIL_SENT")
+        self.assertEqual(EmailOutbox.objects.get().state, "SENT")
+        self.assertEqual(len(self.sink.messages), 1)
+
+    def test_admin_bulk_actions_queue_emails(self):
+        pending = create_application()
+        create_application(status="INTERVIEW_PENDING")
+        client = Client()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        for _ in range(2):
+            response = client.post("/admin/backend/applicationstatus/", {
+                "action": "send_writing_task_email", "_selected_action": list(ApplicationStatus.objects.values_list("pk", flat=True))})
+            self.assertEqual(response.status_code, 302)
+        # the second run finds the email already queued, and nothing is sent in the request
+        self.assertEqual(list(EmailOutbox.objects.values_list("application", "kind")), [(pending.pk, "WRITING_TASK")])
+        self.assertEqual(self.sink.messages, [])
+        self.assertEqual(drain_batch(), {"SENT": 1})
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, "WRTIING_TASK_EMAIL_SENT")
+
+    def test_failed_delivery_keeps_status_and_requeues(self):
+        application = create_application()
+        EmailOutbox.objects.create(application=application)
+        self.sink.stop()
+        with self.assertLogs("backend.email", "ERROR"):
+            self.assertEqual(drain_batch(max_attempts=2), {"PENDING": 1})
+        # the retry waits out its backoff instead of being claimed on the next pass
+        item = EmailOutbox.objects.get()
+        self.assertAlmostEqual((item.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(drain_batch(max_attempts=2), {})
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs("backend.email", "ERROR"):
+            self.assertEqual(drain_batch(max_attempts=2), {"FAILED": 1})
+        self.assertIsNone(EmailOutbox.objects.get().next_attempt_at)
+        application.refresh_from_db()
+        self.assertEqual(application.status, "NEW_APPLICATION")
+
+
+class ApplicantThrottleTests(TestCase):
+    def setUp(self):
+        reset_token_buckets()
+        self.addCleanup(reset_token_buckets)
+
+    @override_settings(APPLICANT_THROTTLES={"applicant-email": {"RATE": 0.001, "BURST": 1}})
+    def test_repeat_submissions_for_one_email_are_throttled(self):
+        data = {**APPLICANT_DATA, "email": "throttled@example.com"}
+        self.assertEqual(APIClient().post("/api/v1/applicants/", data, format="json").status_code, 201)
+        response = APIClient().post("/api/v1/applicants/", data, format="json")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        other = {**APPLICANT_DATA, "email": "other@example.com"}
+        self.assertEqual(APIClient().post("/api/v1/applicants/", other, format="json").status_code, 201)
+
+    @override_settings(APPLICANT_THROTTLES={"applicant-ip": {"RATE": 0.001, "BURST": 2}})
+    def test_client_ip_is_throttled(self):
+        client = APIClient(REMOTE_ADDR="10.1.2.3")
+        for i in range(2):
+            data = {**APPLICANT_DATA, "email": f"ip{i}@example.com"}
+            self.assertEqual(client.post("/api/v1/applicants/", data, format="json").status_code, 201)
+        self.assertEqual(client.post("/api/v1/applicants/", APPLICANT_DATA, format="json").status_code, 429)
+
+    @override_settings(APPLICANT_THROTTLES={"applicant-ip": {"RATE": 0.001, "BURST": 2}})
+    def test_forwarded_for_header_does_not_reset_the_ip_bucket(self):
+        client = APIClient(REMOTE_ADDR="10.1.2.3")
+        for i in range(3):
+            data = {**APPLICANT_DATA, "email": f"spoof{i}@example.com"}
+            response = client.post("/api/v1/applicants/", data, format="json", HTTP_X_FORWARDED_FOR=f"198.51.100.{i}")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF, APPLICANT_THROTTLES={"applicant-ip": {"RATE": 0.001, "BURST": 0}})
+    async def test_async_view_is_throttled(self):
+        response = await AsyncClient().post("/api/v1/applicants/", APPLICANT_DATA, content_type="application/json")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "1000")
+
+    @override_settings(CONCURRENCY_LIMITS={"applicant_create": {"LIMIT": 1, "WAIT": 0, "RETRY_AFTER": 7}})
+    def test_requests_over_the_concurrency_limit_are_shed(self):
+        slots = get_concurrency_limit("applicant_create", 1)
+        self.assertTrue(slots.acquire(0))
+        try:
+            response = APIClient().post("/api/v1/applicants/", APPLICANT_DATA, format="json")
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        self.assertEqual(APIClient().post("/api/v1/applicants/", APPLICANT_DATA, format="json").status_code, 201)
+
+
+class DatabaseTokenBucketTests(TestCase):
+    def test_buckets_are_shared_through_the_database(self):
+        first, second = DatabaseTokenBucket(rate=10, burst=2), DatabaseTokenBucket(rate=10, burst=2)
+        self.assertEqual(first.try_acquire("email:a"), 0)
+        self.assertEqual(second.try_acquire("email:a"), 0)
+        self.assertGreater(first.try_acquire("email:a"), 0)
+
+
+class FailedEmailTests(SinkTestMixin, TestCase):
+    def test_failed_email_is_dead_lettered_and_redriven(self):
+        application = create_application()
+        self.sink.stop()
+        with self.assertLogs("backend.email", "ERROR") as logs:
+            self.assertFalse(application.send_writing_task_email())
+            self.assertFalse(application.send_writing_task_email())
+        self.assertEqual(len(logs.output), 2)
+        failed = FailedEmail.objects.get()
+        self.assertEqual((failed.kind, failed.permanent, failed.attempts), ("WRITING_TASK", False, 4))
+
+        with SMTPSink() as sink, override_settings(EMAIL_SMTP_HOST=sink.host, EMAIL_SMTP_PORT=sink.port):
+            close_smtp_pools()
+            self.assertTrue(failed.redrive())
+            self.assertEqual(len(sink.messages), 1)
+        failed.refresh_from_db()
+        application.refresh_from_db()
+        self.assertTrue(failed.resolved)
+        self.assertEqual(application.status, "WRTIING_TASK_EMAIL_SENT")
+
+    def test_permanent_errors_are_not_retried(self):
+        self.sink.permanent_error_rate = 1
+        application = create_application()
+        with self.assertLogs("backend.email", "ERROR") as logs:
+            self.assertFalse(application.send_writing_task_email())
+        self.assertIn(f"to {application.applicant.email} after 1 attempt(s), permanent error", logs.output[0])
+        failed = FailedEmail.objects.get()
+        self.assertEqual((failed.permanent, failed.error_code, failed.attempts), (True, 550, 1))
+
+    def test_transient_errors_are_retried(self):
+        self.sink.error_rate = 0.5
+        self.sink._random.seed(3)  # first message rejected with 451, second accepted
+        application = create_application()
+        self.assertTrue(application.send_writing_task_email())
+        self.assertEqual((self.sink.rejected, len(self.sink.messages)), (1, 1))
+        self.assertFalse(FailedEmail.objects.exists())
+
+    def test_dropped_connection_is_retried(self):
+        self.sink.drop_rate = 0.5
+        self.sink._random.seed(3)
+        application = create_application()
+        self.assertTrue(application.send_writing_task_email())
+        self.assertEqual((self.sink.dropped, len(self.sink.messages)), (1, 1))
+
+
+class EmailSendLogTests(SinkTestMixin, TestCase):
+    def test_each_send_is_logged_with_stage_durations(self):
+        close_smtp_pools()
+        application = create_application()
+        self.assertTrue(application.send_writing_task_email())
+        log = EmailSendLog.objects.get()
+        self.assertEqual((log.result, log.template, log.attempts), ("SENT", "writing_task", 1))
+        self.assertEqual(log.recipient_hash, recipient_hash(application.applicant.email.upper()))
+        self.assertNotIn(application.applicant.email, log.recipient_hash)
+        self.assertLessEqual({"render", "build", "connect", "auth", "data", "total"}, set(log.durations))
+        self.assertGreater(log.size, 0)
+
+    def test_failures_are_logged(self):
+        self.sink.permanent_error_rate = 1
+        application = create_application()
+        with self.assertLogs("backend.email", "ERROR"):
+            self.assertFalse(application.send_writing_task_email())
+        log = EmailSendLog.objects.get()
+        self.assertEqual((log.result, log.error_code), ("FAILED", 550))
+
+    def test_a_failing_send_log_does_not_fail_the_send(self):
+        application = create_application()
+        with mock.patch.object(EmailSendLog.objects, "create", side_effect=RuntimeError("log table is gone")), \
+                self.assertLogs("backend.email", "ERROR") as logs:
+            self.assertTrue(application.send_writing_task_email())
+        self.assertIn("could not write the send log", logs.output[0])
+        self.assertIn("log table is gone", logs.output[0])
+
+
+class WritingTaskViewTests(TestCase):
+    def test_get_is_one_query_and_matches_serializer(self):
+        application = create_application(status="WRTIING_TASK_SUBMITTED", writing_task_file="writing_task/a.pdf")
+        for dept, status in [("LAW", "NEW_APPLICATION"), ("FIN", "INTERVIEW_PENDING")]:
+            ApplicationStatus.objects.create(applicant=application.applicant, handle_by=dept, status=status)
+        url = f"/api/v1/applicants/writing-tasks/{application.applicant.id}"
+
+        with self.assertNumQueries(1):
+            response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), WritingTaskSerializer(application.applicant).data)
+        self.assertEqual([a["handle_by"] for a in response.json()["applications"]], ["IT", "LAW"])
+
+    def test_get_without_writing_tasks_and_unknown_applicant(self):
+        application = create_application(status="INTERVIEW_PENDING")
+        response = APIClient().get(f"/api/v1/applicants/writing-tasks/{application.applicant.id}")
+        self.assertEqual(response.json(), {"name": "张三", "applications": []})
+        with self.assertNumQueries(1):
+            response = APIClient().get("/api/v1/applicants/writing-tasks/00000000-0000-0000-0000-000000000000")
+        self.assertEqual(response.status_code, 404)
+
+    def test_repeat_polls_are_cached_and_revalidated(self):
+        application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+        url = f"/api/v1/applicants/writing-tasks/{application.applicant.id}"
+        client = APIClient()
+        etag = client.get(url)["ETag"]
+
+        # the local-memory cache checks the version of each hit, a shared cache does not
+        with self.assertNumQueries(1):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        with mock.patch("backend.caching._is_local", return_value=False), self.assertNumQueries(0):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        application.writing_task_video_link = "https://example.com/video"
+        application.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["applications"][0]["writing_task_video_link"], "https://example.com/video")
+
+    def test_changes_saved_by_another_process_are_served_at_once(self):
+        application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+        url = f"/api/v1/applicants/writing-tasks/{application.applicant.id}"
+        etag = APIClient().get(url)["ETag"]
+        # another worker saved the application: this process's cache was not cleared
+        ApplicationStatus.objects.filter(pk=application.pk).update(
+            writing_task_video_link="https://example.com/video", modified_at=timezone.now())
+        response = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["applications"][0]["writing_task_video_link"], "https://example.com/video")
+
+    def test_application_leaving_writing_task_changes_etag(self):
+        application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+        url = f"/api/v1/applicants/writing-tasks/{application.applicant.id}"
+        etag = APIClient().get(url)["ETag"]
+        ApplicationStatus.objects.filter(pk=application.pk).update(status="INTERVIEW_PENDING", modified_at=timezone.now())
+        invalidate_writing_task(application.applicant_id)
+        response = APIClient().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()["applications"]), (200, []))
+
+
+def enforce_budgets(**budgets):
+    """Profile every request and fail the test on any request over its query budget."""
+    # the admin changelist counts twice (filtered and total) with the same statement
+    return override_settings(REQUEST_PROFILING={"ENABLED": True, "RAISE": True, "MAX_DUPLICATES": 1, "BUDGETS": budgets})
+
+
+class QueryBudgetTests(TestCase):
+    @enforce_budgets(**{"backend.views.applicant_writing_task": {"MAX_QUERIES": 1}})
+    def test_writing_task_get_stays_within_budget(self):
+        application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+        url = f"/api/v1/applicants/writing-tasks/{application.applicant.id}"
+        invalidate_writing_task(application.applicant.id)
+        self.assertEqual(Client().get(url).status_code, 200)
+
+        invalidate_writing_task(application.applicant.id)
+        with enforce_budgets(**{"backend.views.applicant_writing_task": {"MAX_QUERIES": 0}}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "1 queries, budget 0"):
+                Client().get(url)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    async def test_async_views_are_held_to_their_budgets(self):
+        application = await sync_to_async(create_application)(status="WRTIING_TASK_EMAIL_SENT")
+        await sync_to_async(invalidate_writing_task)(application.applicant_id)
+        with enforce_budgets(**{"backend.async_views.applicant_writing_task": {"MAX_QUERIES": 0}}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, "1 queries, budget 0"):
+                await AsyncClient().get(f"/api/v1/applicants/writing-tasks/{application.applicant_id}")
+
+    @enforce_budgets()
+    def test_admin_lists_do_not_query_per_row(self):
+        for i in range(5):
+            applicant = Applicant.objects.create(**{**APPLICANT_DATA, "email": f"row{i}@example.com"})
+            application = ApplicationStatus.objects.create(applicant=applicant, handle_by="IT")
+            for interviewer in ["面试官甲", "面试官乙"]:
+                InterviewScore.objects.create(application=application, interviewer=interviewer, score=80)
+        client = Client()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        for url in ["/admin/backend/applicationstatus/", "/admin/backend/interviewscore/",
+                    f"/admin/backend/applicationstatus/{application.id}/change/"]:
+            self.assertEqual(client.get(url).status_code, 200)
+
+
+class InterviewScoreAggregateTests(TestCase):
+    def setUp(self):
+        self.application = create_application(status="INTERVIEW_EMAIL_SENT")
+
+    def assertScores(self, total, count, average):
+        self.application.refresh_from_db()
+        self.assertEqual((self.application.score_sum, self.application.score_count, self.application.avgInterviewScore),
+                         (total, count, average))
+
+    def test_scores_update_the_application_columns_only(self):
+        modified_at = self.application.modified_at
+        first = InterviewScore.objects.create(application=self.application, interviewer="面试官甲", score=80)
+        InterviewScore.objects.create(application=self.application, interviewer="面试官乙", score=90)
+        self.assertScores(170, 2, 85)
+
+        first = InterviewScore.objects.get(pk=first.pk)
+        first.score = 70
+        first.save()
+        self.assertScores(160, 2, 80)
+        self.assertEqual(self.application.modified_at, modified_at)
+
+        first.delete()
+        self.assertScores(90, 1, 90)
+        self.application.interview_scores.all().delete()
+        self.assertScores(0, 0, None)
+
+    def test_saving_a_stale_application_keeps_new_scores(self):
+        stale = ApplicationStatus.objects.get(pk=self.application.pk)
+        InterviewScore.objects.create(application=self.application, interviewer="面试官甲", score=80)
+        stale.remark = "备注"
+        stale.save()
+        self.assertScores(80, 1, 80)
+        self.assertEqual(self.application.remark, "备注")
+
+    def test_full_saves_still_insert_missing_rows(self):
+        ApplicationStatus.objects.filter(pk=self.application.pk).update(score_sum=80, score_count=1, avgInterviewScore=80)
+        loaded = ApplicationStatus.objects.get(pk=self.application.pk)
+        for kwargs in [{}, {"force_insert": True}]:
+            with self.subTest(**kwargs):
+                ApplicationStatus.objects.filter(pk=loaded.pk).delete()
+                loaded.save(**kwargs)
+                self.assertScores(80, 1, 80)
+
+    def test_repair_recomputes_drifted_applications(self):
+        InterviewScore.objects.create(application=self.application, interviewer="面试官甲", score=80)
+        InterviewScore.objects.create(application=self.application, interviewer="面试官乙", score=70)
+        ApplicationStatus.objects.filter(pk=self.application.pk).update(score_sum=0, score_count=0,
+                                                                        avgInterviewScore=None)
+        stdout = io.StringIO()
+        call_command("repair_interview_scores", "--dry-run", stdout=stdout)
+        self.assertIn("fixed 1 applications", stdout.getvalue())
+        self.assertScores(0, 0, None)
+        call_command("repair_interview_scores", stdout=io.StringIO())
+        self.assertScores(150, 2, 75)
+        stdout = io.StringIO()
+        call_command("repair_interview_scores", stdout=stdout)
+        self.assertIn("fixed 0 applications", stdout.getvalue())
+
+
+def insert_rows(template, rows):
+    """Insert copies of ``template`` with the column values in ``rows``, far faster than bulk_create at 100k rows."""
+    fields = template._meta.concrete_fields
+    values = {field.column: field.get_db_prep_save(getattr(template, field.attname), connection) for field in fields}
+    columns = list(values)
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        connection.ops.quote_name(template._meta.db_table), ", ".join(map(connection.ops.quote_name, columns)),
+        ", ".join(["%s"] * len(columns)))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [[row.get(column, values[column]) for column in columns] for row in rows])
+
+
+@skipUnless(connection.vendor == "sqlite", "reads SQLite query plans")
+class IndexUsageTests(TestCase):
+    """The hot queries on a realistically sized table are answered from an index, not a scan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        depts = [code for code, _ in DEPARTMENTS]
+        grades = [code for code, _ in Applicant.YEAR_IN_SCHOOL_CHOICES]
+        statuses = [code for code, _ in ApplicationStatus.APPLICATION_STATUS]
+        cls.applicant = create_application().applicant
+        ids = [uuid.uuid4() for _ in range(25_000)]
+        insert_rows(cls.applicant, [
+            {"id": id.hex, "email": f"a{i}@example.com", "grade": grades[i % len(grades)],
+             "first_choice": depts[i % len(depts)], "second_choice": depts[(i + 1) % len(depts)], "src": f"src{i % 20}"}
+            for i, id in enumerate(ids)
+        ])
+        insert_rows(cls.applicant.applications.get(), [
+            {"id": None, "applicant_id": id.hex, "handle_by": depts[(i + j) % len(depts)],
+             "status": statuses[(i * 4 + j) % len(statuses)]}
+            for i, id in enumerate(ids) for j in range(4) if i or j
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertIn("USING", plan)
+        # a SCAN or SEARCH without USING reads the whole table, and a TEMP B-TREE for the
+        # whole ORDER BY sorts every matching row
+        for line in plan.splitlines():
+            step = line.split(" ", 1)[-1] if line[:1].isdigit() else line.strip("-` ")
+            if step.startswith(("SCAN", "SEARCH")):
+                self.assertIn("USING", step, plan)
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_application_queries_use_indexes(self):
+        self.assertEqual(ApplicationStatus.objects.count(), 100_000)
+        now = timezone.now() + timedelta(days=30)
+        for queryset in [
+            ApplicationStatus.objects.filter(handle_by="IT"),
+            ApplicationStatus.objects.filter(handle_by="IT", status="NEW_APPLICATION"),
+            # check_writing_task_expired updates these, and an UPDATE is not ordered
+            ApplicationStatus.objects.filter(status="WRTIING_TASK_EMAIL_SENT", writing_task_ddl__lt=now).order_by(),
+            ApplicationStatus.objects.filter(applicant=self.applicant, handle_by="IT"),
+            self.applicant.applications.filter(status__in=["WRTIING_TASK_EMAIL_SENT", "WRTIING_TASK_SUBMITTED"]),
+        ]:
+            with self.subTest(str(queryset.query)):
+                self.assertUsesIndex(queryset)
+
+    def test_applicant_filters_use_indexes(self):
+        for lookup in [{"first_choice": "IT"}, {"second_choice": "IT"}, {"grade": "UG2"}, {"src": "src3"}]:
+            with self.subTest(**lookup):
+                self.assertUsesIndex(Applicant.objects.filter(**lookup))
+
+
+class ReplayTrafficTests(TransactionTestCase):
+    # the command sends its requests from worker threads, which need committed data
+    def test_capture_is_replayed_and_seeded_rows_removed(self):
+        applicant, session = uuid.uuid4(), uuid.uuid4()
+        capture = [
+            {"ts": 0, "method": "POST", "path": "/api/v1/applicants/", "json": {**APPLICANT_DATA, "email": "new@example.com"}},
+            {"ts": 1, "method": "GET", "path": f"/api/v1/applicants/writing-tasks/{applicant}"},
+            {"ts": 2, "method": "POST", "path": f"/api/v1/applicants/writing-tasks/uploads/{applicant}",
+             "json": {"handle_by": "IT", "file_name": "task.pdf", "size": 2048}, "session": str(session)},
+            {"ts": 3, "method": "PUT", "path": f"/api/v1/applicants/writing-tasks/uploads/sessions/{session}",
+             "headers": {"Upload-Offset": "0"}, "body_size": 2048},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write("\n".join(map(json.dumps, capture)) + "\nnot a request\n")
+        self.addCleanup(os.remove, f.name)
+        stdout = io.StringIO()
+        call_command("replay_traffic", f.name, "--speedup", "0", "--concurrency", "1", stdout=stdout)
+
+        output = stdout.getvalue()
+        self.assertIn("replaying 4 requests (1 lines skipped)", output)
+        self.assertIn("seeded 1 applicants, 0 already existed", output)
+        for name in ["POST /api/v1/applicants/", "GET /api/v1/applicants/writing-tasks/<pk>",
+                     "POST /api/v1/applicants/writing-tasks/uploads/<pk>",
+                     "PUT /api/v1/applicants/writing-tasks/uploads/sessions/<pk>"]:
+            report = output.split(f"{name}\n", 1)[1].splitlines()[0]
+            self.assertIn("1 requests in", report)
+            self.assertIn("failures 0  4xx 0  error rate 0.0%", report)
+        self.assertIn("total: 4 requests in", output)
+        # the PUT only succeeds once the captured session id is mapped to the new session
+        self.assertFalse(Applicant.objects.filter(src=REPLAY_SRC).exists())
+        self.assertFalse(UploadSession.objects.exists())
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        cache.delete(STATUS_COUNTS_KEY)
+
+    def test_scrape_exports_requests_and_application_counts(self):
+        application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+        Client().get(f"/api/v1/applicants/writing-tasks/{application.applicant.id}")
+        metrics.histogram("email_stage_seconds", stage="total").observe(0.3)
+
+        body = Client().get("/metrics").content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="backend.views.applicant_writing_task"} 1',
+                      body)
+        self.assertIn('email_stage_seconds_bucket{stage="total",le="0.25"} 0', body)
+        self.assertIn('email_stage_seconds_bucket{stage="total",le="+Inf"} 1', body)
+        self.assertIn('applications{handle_by="IT",status="WRTIING_TASK_EMAIL_SENT"} 1', body)
+
+        create_application()
+        with self.assertNumQueries(0):
+            body = Client().get("/metrics").content.decode()
+        # counted from the cache until STATUS_COUNTS_TTL runs out
+        self.assertNotIn('status="NEW_APPLICATION"', body)
+
+    @override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+    async def test_async_requests_are_counted(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        # an async-capable middleware stays a coroutine, so Django need not adapt it
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+        application = await sync_to_async(create_application)(status="WRTIING_TASK_EMAIL_SENT")
+        await sync_to_async(invalidate_writing_task)(application.applicant_id)
+        response = await AsyncClient().get(f"/api/v1/applicants/writing-tasks/{application.applicant_id}")
+        self.assertEqual(response.status_code, 200)
+        view = "backend.async_views.applicant_writing_task"
+        self.assertEqual(metrics.counter("http_requests_total", view=view, method="GET", status="200").value, 1)
+        self.assertGreater(metrics.counter("db_queries_total", view=view).value, 0)
+
+    def test_only_allowed_addresses_may_scrape(self):
+        self.assertEqual(Client(REMOTE_ADDR="10.0.0.1").get("/metrics").status_code, 403)
+
+
+class UploadTestMixin:
+    """Gives each test an empty MEDIA_ROOT and an application waiting for its writing task."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.application = create_application(status="WRTIING_TASK_EMAIL_SENT")
+
+
+class WritingTaskUploadTests(UploadTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/v1/applicants/writing-tasks/files/{self.application.applicant.id}"
+
+    def put(self, content, content_type="application/pdf"):
+        upload = SimpleUploadedFile("task.pdf", content, content_type=content_type)
+        return APIClient().put(self.url, {"handle_by": "IT", "writing_task_file": upload}, format="multipart")
+
+    def test_pdf_is_streamed_to_storage_with_its_hash(self):
+        content = b"%PDF-1.7\n" + os.urandom(200 * 1024)
+        response = self.put(content, content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 201)
+        self.application.refresh_from_db()
+        self.assertEqual(self.application.status, "WRTIING_TASK_SUBMITTED")
+        self.assertEqual(self.application.writing_task_sha256, hashlib.sha256(content).hexdigest())
+        with self.application.writing_task_file.open("rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(os.listdir(os.path.join(self.application.writing_task_file.storage.location, ".uploads")), [])
+
+    def test_rejections(self):
+        self.assertEqual(self.put(b"MZ not a pdf", content_type="application/pdf").data, "File type not supported")
+        self.assertEqual(self.put(b"%PDF-1.7\n" + bytes(10 * 1024 * 1024)).data, "File size too large")
+        response = APIClient().put(self.url, b"", content_type="multipart/form-data; boundary=x",
+                                   CONTENT_LENGTH=str(200 * 1024 * 1024))
+        self.assertEqual((response.status_code, response.data), (400, "File size too large"))
+        self.application.refresh_from_db()
+        self.assertEqual(self.application.status, "WRTIING_TASK_EMAIL_SENT")
+
+
+class ContentAddressedStorageTests(UploadTestMixin, TestCase):
+    def put(self, application, content):
+        return APIClient().put(f"/api/v1/applicants/writing-tasks/files/{application.applicant.id}",
+                               {"handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", content)},
+                               format="multipart")
+
+    def test_identical_uploads_share_one_reference_counted_blob(self):
+        other = ApplicationStatus.objects.create(
+            applicant=Applicant.objects.create(**{**APPLICANT_DATA, "email": "other@example.com"}),
+            handle_by="IT", status="WRTIING_TASK_EMAIL_SENT")
+        content = b"%PDF-1.7\n" + os.urandom(1024)
+        sha256 = hashlib.sha256(content).hexdigest()
+        for application in [self.application, other]:
+            self.assertEqual(self.put(application, content).status_code, 201)
+            application.refresh_from_db()
+        name = f"writing_task/{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf"
+        self.assertEqual([self.application.writing_task_file.name, other.writing_task_file.name], [name, name])
+        self.assertEqual(FileBlob.objects.get(name=name).refcount, 2)
+
+        storage = self.application.writing_task_file.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            self.application.delete()
+        self.assertTrue(storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().delete(f"/api/v1/applicants/writing-tasks/files/{other.applicant.id}",
+                               {"handle_by": "IT"}, format="json")
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(FileBlob.objects.exists())
+
+    def test_reupload_releases_the_replaced_file(self):
+        self.put(self.application, b"%PDF-1.7\nfirst")
+        self.application.refresh_from_db()
+        first = self.application.writing_task_file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.put(self.application, b"%PDF-1.7\nsecond")
+        self.assertFalse(self.application.writing_task_file.storage.exists(first))
+        self.assertEqual(FileBlob.objects.count(), 1)
+
+    def test_migrate_command_moves_legacy_files(self):
+        storage = self.application.writing_task_file.storage
+        legacy = f"writing_task/user_{self.application.applicant.id}/IT-task.pdf"
+        os.makedirs(os.path.dirname(storage.path(legacy)))
+        with open(storage.path(legacy), "wb") as f:
+            f.write(b"%PDF-1.7\nlegacy")
+        ApplicationStatus.objects.filter(pk=self.application.pk).update(writing_task_file=legacy)
+
+        call_command("migrate_writing_task_files", stdout=open(os.devnull, "w"))
+        self.application.refresh_from_db()
+        self.assertTrue(storage.is_blob(self.application.writing_task_file.name))
+        with storage.open(self.application.writing_task_file.name) as f:
+            self.assertEqual(f.read(), b"%PDF-1.7\nlegacy")
+        self.assertFalse(os.path.exists(os.path.dirname(storage.path(legacy))))
+        self.assertEqual(FileBlob.objects.get().refcount, 1)
+
+
+def make_pdf(pages, text=None):
+    """A small well-formed PDF with ``pages`` pages, empty or each showing ``text``."""
+    kids = " ".join(f"{3 + i} 0 R" for i in range(pages))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()]
+    page = b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842]"
+    if text:
+        font, contents = 3 + pages, 4 + pages
+        page += f" /Resources << /Font << /F1 {font} 0 R >> >> /Contents {contents} 0 R".encode()
+    objects += [page + b" >>"] * pages
+    if text:
+        stream = f"BT /F1 24 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects += [b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+                    f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream"]
+    body, offsets = b"%PDF-1.4\n", []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n".encode() + content + b"\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return body
+
+
+class DocumentPipelineTests(UploadTestMixin, TestCase):
+    def test_submissions_are_parsed_in_worker_processes(self):
+        other = ApplicationStatus.objects.create(
+            applicant=Applicant.objects.create(**{**APPLICANT_DATA, "email": "other@example.com"}),
+            handle_by="IT", status="WRTIING_TASK_EMAIL_SENT")
+        for application, content in [(self.application, make_pdf(2)), (other, make_pdf(3)[:-200])]:
+            APIClient().put(f"/api/v1/applicants/writing-tasks/files/{application.applicant.id}",
+                            {"handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", content)},
+                            format="multipart")
+        self.assertEqual(FileBlob.objects.filter(state="PENDING").count(), 2)
+
+        with pdf_executor(2) as executor:
+            self.assertEqual(process_batch(executor), {"DONE": 1, "FAILED": 1})
+            self.assertEqual(process_batch(executor), {})
+        self.application.refresh_from_db()
+        parsed = FileBlob.objects.get(name=self.application.writing_task_file.name)
+        self.assertEqual(parsed.page_count, 2)
+        self.assertIsNotNone(FileBlob.objects.get(state="FAILED").error)
+
+    def test_text_and_thumbnail_are_stored(self):
+        APIClient().put(f"/api/v1/applicants/writing-tasks/files/{self.application.applicant.id}",
+                        {"handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", make_pdf(1, "Saga answer"))},
+                        format="multipart")
+        with pdf_executor(1) as executor:
+            self.assertEqual(process_batch(executor), {"DONE": 1})
+        blob = FileBlob.objects.get()
+        self.assertIn("Saga answer", blob.text)
+        self.assertTrue(FileBlob.objects.filter(text__icontains="saga answer").exists())
+        storage = self.application.writing_task_file.storage
+        self.assertEqual(blob.thumbnail, storage.thumbnail_name(blob.name))
+        with storage.open(blob.thumbnail, "rb") as f:
+            self.assertEqual(f.read(8), b"\x89PNG\r\n\x1a\n")
+
+
+class MediaServingTests(UploadTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = make_pdf(2)
+        APIClient().put(f"/api/v1/applicants/writing-tasks/files/{self.application.applicant.id}",
+                        {"handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", self.content)},
+                        format="multipart")
+        self.application.refresh_from_db()
+
+    def staff_client(self, department):
+        user = User.objects.create_user(f"staff-{department}", is_staff=True)
+        user.groups.add(Group.objects.get_or_create(name=department)[0])
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def signed_url(self):
+        response = self.staff_client("IT").get(f"/media-files/application/{self.application.pk}")
+        self.assertEqual(response.status_code, 302)
+        return response["Location"]
+
+    def test_department_scope_then_signed_url_without_queries(self):
+        self.assertEqual(self.staff_client("LAW").get(f"/media-files/application/{self.application.pk}").status_code, 404)
+        url = self.signed_url()
+        with self.assertNumQueries(0):
+            response = Client().get(url)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertIn("filename*=UTF-8''%E5%BC%A0%E4%B8%89-IT%E9%83%A8.pdf", response["Content-Disposition"])
+        self.assertEqual(Client().get(url[:-4] + "abcd").status_code, 403)
+        with override_settings(MEDIA_SIGNED_URL_MAX_AGE=-1):
+            self.assertEqual(Client().get(url).status_code, 403)
+
+    def test_range_requests(self):
+        url = self.signed_url()
+        response = Client().get(url, headers={"Range": "bytes=0-9"})
+        self.assertEqual((response.status_code, response["Content-Range"]), (206, f"bytes 0-9/{len(self.content)}"))
+        self.assertEqual(b"".join(response.streaming_content), self.content[:10])
+        response = Client().get(url, headers={"Range": "bytes=-6"})
+        self.assertEqual(b"".join(response.streaming_content), self.content[-6:])
+        self.assertEqual(Client().get(url, headers={"Range": f"bytes={len(self.content)}-"}).status_code, 416)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT="/protected-media/")
+    def test_transfer_is_handed_to_nginx(self):
+        response = Client().get(self.signed_url())
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.application.writing_task_file.name}")
+        self.assertEqual(response.content, b"")
+
+
+class AdminDepartmentScopeTests(UploadTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        APIClient().put(f"/api/v1/applicants/writing-tasks/files/{self.application.applicant.id}",
+                        {"handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", make_pdf(1))},
+                        format="multipart")
+        EmailOutbox.objects.create(application=self.application, kind="INTERVIEW", state="FAILED")
+        FailedEmail.objects.create(application=self.application, kind="INTERVIEW", recipient="zhangsan@example.com",
+                                   error="refused")
+        EmailSendLog.objects.create(recipient_hash="0" * 64, sender="noreply", size=100, duration=1, result="SENT")
+
+    def staff_client(self, department):
+        user = User.objects.create_user(f"staff-{department}", is_staff=True)
+        user.groups.add(Group.objects.get_or_create(name=department)[0])
+        user.user_permissions.add(*Permission.objects.filter(content_type__app_label="backend",
+                                                             codename__startswith="view_"))
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_email_and_file_lists_are_scoped_to_department(self):
+        for department, count in [("IT", 1), ("LAW", 0)]:
+            client = self.staff_client(department)
+            for model in ["emailoutbox", "failedemail", "fileblob"]:
+                with self.subTest(department=department, model=model):
+                    response = client.get(f"/admin/backend/{model}/")
+                    self.assertEqual(response.context["cl"].result_count, count)
+            self.assertEqual(client.get("/admin/backend/emailsendlog/").status_code, 403)
+
+        client = Client()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        self.assertEqual(client.get("/admin/backend/emailsendlog/").context["cl"].result_count, 1)
+
+
+class WritingTaskZipTests(UploadTestMixin, TestCase):
+    def test_admin_action_streams_selected_files(self):
+        other = ApplicationStatus.objects.create(applicant=self.application.applicant, handle_by="LAW",
+                                                 status="WRTIING_TASK_EMAIL_SENT")
+        contents = {}
+        for application, pages in [(self.application, 1), (other, 2)]:
+            contents[application.handle_by] = make_pdf(pages)
+            APIClient().put(f"/api/v1/applicants/writing-tasks/files/{application.applicant.id}",
+                            {"handle_by": application.handle_by,
+                             "writing_task_file": SimpleUploadedFile("task.pdf", contents[application.handle_by])},
+                            format="multipart")
+        client = Client()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        response = client.post("/admin/backend/applicationstatus/", {
+            "action": "download_writing_tasks", "_selected_action": [self.application.pk, other.pk]})
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ["张三-IT部.pdf", "张三-法务部.pdf"])
+            self.assertEqual(archive.read("张三-法务部.pdf"), contents["LAW"])
+            self.assertEqual({info.compress_type for info in archive.infolist()}, {zipfile.ZIP_STORED})
+
+    def test_archive_is_written_while_files_are_read(self):
+        path = os.path.join(tempfile.mkdtemp(dir=self.media_root), "big.pdf")
+        with open(path, "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+        chunks = stream_zip([("a.pdf", path), ("b.pdf", path)])
+        self.assertLess(len(next(chunks)), 128 * 1024)
+        rest = b"".join(chunks)
+        self.assertGreater(len(rest), 2 * 1024 * 1024)
+
+
+class ResumableUploadTests(UploadTestMixin, TestCase):
+    def create_session(self, size):
+        response = APIClient().post(f"/api/v1/applicants/writing-tasks/uploads/{self.application.applicant.id}",
+                                    {"handle_by": "IT", "file_name": "task.pdf", "size": size}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return f"/api/v1/applicants/writing-tasks/uploads/sessions/{response.data['id']}"
+
+    def put_chunk(self, url, chunk, offset):
+        return APIClient().generic("PUT", url, chunk, content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_resume_from_reported_offset_and_finalize(self):
+        content = b"%PDF-1.7\n" + os.urandom(300 * 1024)
+        url = self.create_session(len(content))
+        self.assertEqual(self.put_chunk(url, content[:100000], 0).data["offset"], 100000)
+        # a retried chunk at a stale offset is refused with the offset to resume from
+        response = self.put_chunk(url, content[:100000], 0)
+        self.assertEqual((response.status_code, response.data), (409, {"offset": 100000}))
+        self.assertEqual(APIClient().post(url + "/finalize").status_code, 409)
+
+        offset = APIClient().get(url).data["offset"]
+        self.assertEqual(self.put_chunk(url, content[offset:], offset).data["offset"], len(content))
+        response = APIClient().post(url + "/finalize")
+        self.assertEqual(response.status_code, 201)
+
+        self.application.refresh_from_db()
+        self.assertEqual(self.application.status, "WRTIING_TASK_SUBMITTED")
+        self.assertEqual(self.application.writing_task_sha256, hashlib.sha256(content).hexdigest())
+        with self.application.writing_task_file.open("rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(UploadSession.objects.get().state, "COMPLETED")
+        self.assertEqual(os.listdir(os.path.join(self.application.writing_task_file.storage.location, ".uploads")), [])
+
+    def test_rejections(self):
+        url = self.create_session(1000)
+        self.assertEqual(self.put_chunk(url, b"MZ" * 10, 0).data, "File type not supported")
+        self.assertEqual(self.put_chunk(url, b"%PDF-" + bytes(2000), 0).data, "File size too large")
+        self.assertEqual(self.put_chunk(url, b"%PDF-" + bytes(995), 0).status_code, 200)
+        ApplicationStatus.objects.filter(pk=self.application.pk).update(writing_task_ddl=timezone.now())
+        self.assertEqual(APIClient().post(url + "/finalize").data, "Writing task deadline has passed")
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncViewTests(UploadTestMixin, TestCase):
+    async def test_create_queues_email(self):
+        response = await AsyncClient().post("/api/v1/applicants/", {**APPLICANT_DATA, "email": "lisi@example.com"},
+                                            content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["email"], "lisi@example.com")
+        self.assertTrue(await EmailOutbox.objects.filter(application__applicant__email="lisi@example.com").aexists())
+
+        response = await AsyncClient().post("/api/v1/applicants/", {"name": "x"}, content_type="application/json")
+        self.assertIn("email", response.json())
+
+        # form bodies are parsed in a thread
+        response = await AsyncClient().post("/api/v1/applicants/", {**APPLICANT_DATA, "email": "wangwu@example.com"})
+        self.assertEqual(response.status_code, 201)
+
+    async def test_writing_task_get_matches_sync_view(self):
+        url = f"/api/v1/applicants/writing-tasks/{self.application.applicant.id}"
+        response = await AsyncClient().get(url)
+        expected = await sync_to_async(lambda: dict(WritingTaskSerializer(self.application.applicant).data))()
+        self.assertEqual(response.json(), expected)
+        response = await AsyncClient().get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await AsyncClient().get(url.replace(url[-36:], "0" * 8 + url[-28:]))).status_code, 404)
+
+    async def test_file_upload(self):
+        url = f"/api/v1/applicants/writing-tasks/files/{self.application.applicant.id}"
+        content = b"%PDF-1.7\n" + os.urandom(1024)
+        response = await AsyncClient().put(url, encode_multipart(BOUNDARY, {
+            "handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", content)}),
+            content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 201)
+        await self.application.arefresh_from_db()
+        self.assertEqual(self.application.writing_task_sha256, hashlib.sha256(content).hexdigest())
+
+        response = await AsyncClient().put(url, encode_multipart(BOUNDARY, {
+            "handle_by": "IT", "writing_task_file": SimpleUploadedFile("task.pdf", b"MZ")}),
+            content_type=MULTIPART_CONTENT)
+        self.assertEqual(response.json(), "File type not supported")
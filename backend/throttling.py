@@ -0,0 +1,158 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .email import recipient_hash
+from .ratelimit import get_token_bucket
+
+
+class BucketThrottle(BaseThrottle, ABC):
+    """
+    A DRF throttle drawing one token per request from a bucket in ratelimit.py.
+
+    The limit is ``APPLICANT_THROTTLES[scope]``; a scope without a limit, or a
+    request without a key, is never throttled. ``check`` and ``acheck`` take the
+    parsed body explicitly so the async views can use the same throttles.
+    """
+    scope = None
+
+    def __init__(self):
+        self._wait = 0
+
+    @abstractmethod
+    def get_key(self, request, data):
+        """What the request is counted against, or None to let it through."""
+
+    def _bucket(self):
+        limit = getattr(settings, "APPLICANT_THROTTLES", {}).get(self.scope)
+        if limit:
+            return get_token_bucket(limit["RATE"], limit["BURST"], getattr(settings, "APPLICANT_THROTTLE_BACKEND", "local"))
+        return None
+
+    def check(self, request, data):
+        """Seconds until this request may go through, 0 if it may now."""
+        bucket, key = self._bucket(), self.get_key(request, data)
+        if bucket is None or key is None:
+            return 0
+        return bucket.try_acquire(f"{self.scope}:{key}")
+
+    async def acheck(self, request, data):
+        bucket, key = self._bucket(), self.get_key(request, data)
+        if bucket is None or key is None:
+            return 0
+        return await bucket.atry_acquire(f"{self.scope}:{key}")
+
+    def allow_request(self, request, view):
+        self._wait = self.check(request, request.data)
+        return self._wait <= 0
+
+    def wait(self):
+        return self._wait
+
+
+class ApplicantIPThrottle(BucketThrottle):
+    scope = "applicant-ip"
+
+    def get_key(self, request, data):
+        return self.get_ident(request)
+
+
+class ApplicantEmailThrottle(BucketThrottle):
+    """Keyed by a hash of the submitted address, so the bucket table holds no email addresses."""
+    scope = "applicant-email"
+
+    def get_key(self, request, data):
+        email = data.get("email") if hasattr(data, "get") else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        return recipient_hash(email)
+
+
+APPLICANT_THROTTLE_CLASSES = [ApplicantIPThrottle, ApplicantEmailThrottle]
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` requests inside the block at once, per process; the rest wait up to ``wait`` seconds."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self, wait):
+        return self._semaphore.acquire(timeout=wait)
+
+    async def aacquire(self, wait, interval=0.01):
+        # a threading semaphore cannot be awaited, so poll it without blocking the loop
+        deadline = time.monotonic() + wait
+        while not self._semaphore.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(interval)
+        return True
+
+    def release(self):
+        self._semaphore.release()
+
+
+_limits = {}
+_limits_lock = threading.Lock()
+
+
+def get_concurrency_limit(name, limit):
+    with _limits_lock:
+        if (name, limit) not in _limits:
+            _limits[(name, limit)] = ConcurrencyLimit(limit)
+        return _limits[(name, limit)]
+
+
+def _overloaded(retry_after):
+    response = JsonResponse({"detail": "Service busy, please try again later."}, status=503)
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def limit_concurrency(name):
+    """
+    Shed load on a view: past ``CONCURRENCY_LIMITS[name]["LIMIT"]`` requests in
+    flight, new ones wait at most ``WAIT`` seconds for a slot and then get a 503
+    with ``Retry-After`` instead of queueing for a worker. Works on sync and
+    async views; a view without a configured limit is left alone.
+    """
+    def decorator(view):
+        def config():
+            return getattr(settings, "CONCURRENCY_LIMITS", {}).get(name)
+
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                limit = config()
+                if not limit:
+                    return await view(request, *args, **kwargs)
+                slots = get_concurrency_limit(name, limit["LIMIT"])
+                if not await slots.aacquire(limit["WAIT"]):
+                    return _overloaded(limit["RETRY_AFTER"])
+                try:
+                    return await view(request, *args, **kwargs)
+                finally:
+                    slots.release()
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                limit = config()
+                if not limit:
+                    return view(request, *args, **kwargs)
+                slots = get_concurrency_limit(name, limit["LIMIT"])
+                if not slots.acquire(limit["WAIT"]):
+                    return _overloaded(limit["RETRY_AFTER"])
+                try:
+                    return view(request, *args, **kwargs)
+                finally:
+                    slots.release()
+        return wrapper
+    return decorator
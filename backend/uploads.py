@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+
+MAX_WRITING_TASK_SIZE = 10 * 1024 * 1024
+# room for the multipart boundaries, headers and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+PDF_MAGIC = b"%PDF-"
+CHUNK_SIZE = 64 * 1024
+
+
+def upload_temp_dir():
+    """Temporary files live under MEDIA_ROOT, so saving an upload to storage is a rename, not a copy."""
+    path = os.path.join(settings.MEDIA_ROOT, ".uploads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def body_too_large(request, max_size=MAX_WRITING_TASK_SIZE):
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return False
+    return content_length > max_size + MULTIPART_OVERHEAD
+
+
+class StreamedUploadedFile(TemporaryUploadedFile):
+    """A TemporaryUploadedFile in ``upload_temp_dir()``, with the SHA-256 of its content in ``sha256``."""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix=".upload" + ext, dir=upload_temp_dir())
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = None
+
+
+class PDFUploadHandler(FileUploadHandler):
+    """
+    Streams the ``field_name`` upload to disk, checking it on the way.
+
+    The upload is stopped without reading the rest of the body as soon as it
+    exceeds ``max_size`` or its first chunk is not a PDF, and the reason is left
+    in ``error``. Other file fields are passed on to the next handlers.
+
+    Requests whose Content-Length is already too large should be turned away
+    with ``body_too_large`` before the body is parsed at all.
+    """
+
+    def __init__(self, request=None, field_name="writing_task_file", max_size=MAX_WRITING_TASK_SIZE):
+        super().__init__(request)
+        self.target_field = field_name
+        self.max_size = max_size
+        self.error = None
+        self.active = False
+
+    def _reject(self, error):
+        self.error = error
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.active = field_name == self.target_field
+        if self.active:
+            self.file = StreamedUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+            self._sha256 = hashlib.sha256()
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if start == 0 and PDF_MAGIC not in raw_data[:1024]:
+            self._reject("File type not supported")
+        if start + len(raw_data) > self.max_size:
+            self._reject("File size too large")
+        self._sha256.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        if file_size == 0:
+            # an empty file never reached receive_data_chunk
+            self.file.close()
+            self.error = "File type not supported"
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self._sha256.hexdigest()
+        return self.file
+
+
+class AssembledFile(File):
+    """A finished resumable upload on disk; file storage moves it into place instead of copying it."""
+
+    def __init__(self, path, name):
+        super().__init__(open(path, "rb"), name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
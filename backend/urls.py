@@ -1,13 +1,20 @@
-from backend import views
+from backend import async_views, views
+from django.conf import settings
 from django.urls import path, re_path
 from rest_framework.urlpatterns import format_suffix_patterns
 
 
+def build_urlpatterns(api):
+    """The API routes, with the applicant views taken from ``api`` (views or async_views)."""
+    return format_suffix_patterns([
+        path('applicants/', api.applicant_create),
+        re_path(r'^applicants/writing-tasks/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', api.applicant_writing_task),
+        re_path(r'^applicants/writing-tasks/files/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', api.file_detail),
+        re_path(r'^applicants/writing-tasks/uploads/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', views.upload_session_create),
+        re_path(r'^applicants/writing-tasks/uploads/sessions/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', views.upload_session_detail),
+        re_path(r'^applicants/writing-tasks/uploads/sessions/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})/finalize$', views.upload_session_finalize),
+    ])
 
-urlpatterns = [
-    path('applicants/', views.applicant_create),
-    re_path(r'^applicants/writing-tasks/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', views.applicant_writing_task),
-    re_path(r'^applicants/writing-tasks/files/(?P<pk>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$', views.file_detail),
-]
 
-urlpatterns = format_suffix_patterns(urlpatterns)
\ No newline at end of file
+# async views avoid a thread hop per request under ASGI, sync views suit WSGI
+urlpatterns = build_urlpatterns(async_views if getattr(settings, "ASYNC_VIEWS", False) else views)
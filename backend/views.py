@@ -1,37 +1,96 @@
-from .models import Applicant, ApplicationStatus
-from .serializers import WritingTaskSerializer, CreateApplicantSerializer, WritingTaskStatusSerializer
+import os
+
+from . import metrics
+from .caching import get_writing_task
+from .models import Applicant, ApplicationStatus, EmailOutbox, UploadSession
+from .serializers import CreateApplicantSerializer, CreateUploadSessionSerializer, WritingTaskStatusSerializer
+from .throttling import APPLICANT_THROTTLE_CLASSES, limit_concurrency
+from .uploads import CHUNK_SIZE, PDF_MAGIC, AssembledFile, PDFUploadHandler, body_too_large, file_sha256
 
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
 
+from django.db import transaction
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+# Helpers shared with the async views in async_views.py
+
+def create_applicant(serializer):
+    # the invitation is sent by the drain_email_outbox worker, not on the request path
+    with transaction.atomic():
+        instance = serializer.save()
+        new_application = ApplicationStatus(applicant=instance, handle_by=instance.first_choice)
+        new_application.save()
+        EmailOutbox.objects.create(application=new_application, kind="WRITING_TASK")
+
+
+def writing_task_response(request, entry, render):
+    """Answer from a cached ``(etag, last_modified, data)`` entry, with a 304 if the client is up to date."""
+    etag, last_modified, data = entry
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is None:
+        response = render(data)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def release_file(name, storage):
+    """Drop the reference to a replaced file; the storage deletes it once nothing else uses it."""
+    if name:
+        storage.delete(name)
+
+
+def save_writing_task_file(serializer, application, file):
+    previous = application.writing_task_file.name
+    serializer.save(writing_task_sha256=file.sha256)
+    release_file(previous, application.writing_task_file.storage)
+    metrics.histogram("writing_task_upload_bytes", buckets=metrics.SIZE_BUCKETS, mode="form").observe(file.size)
+    application.status = "WRTIING_TASK_SUBMITTED"
+    application.save()
+
+
+def delete_writing_task_file(application):
+    application.writing_task_file.delete()
+    application.writing_task_sha256 = None
+    application.status = "WRTIING_TASK_EMAIL_SENT"
+    application.save()
+
 
+# throttled per client IP and per email address, and shed with a 503 during
+# announcement bursts so the other views keep some workers
+@limit_concurrency("applicant_create")
 @api_view(["POST"])
+@throttle_classes(APPLICANT_THROTTLE_CLASSES)
 def applicant_create(request, format=None):
     if request.method == "POST":
         serializer = CreateApplicantSerializer(data=request.data)
         if serializer.is_valid():
-            instance = serializer.save()
-            new_application = ApplicationStatus(applicant=instance, handle_by=instance.first_choice)
-            new_application.save()
-            new_application.send_writing_task_email()
+            create_applicant(serializer)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(["GET", "PUT"])
 def applicant_writing_task(request, pk, format=None):
+    if request.method == "GET":
+        # applicants reload this page a lot before the deadline: it is cached until the
+        # application changes, and clients that have the current version get a 304
+        entry = get_writing_task(pk)
+        if entry is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return writing_task_response(request, entry, Response)
+
     try:
         applicant = Applicant.objects.get(pk=pk)
     except Applicant.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
-    
-    if request.method == "GET":
-        serializer = WritingTaskSerializer(applicant)
-        return Response(serializer.data)
 
-    elif request.method == "PUT":
+    if request.method == "PUT":
         try:
             dept = request.data.get("handle_by")
             application = applicant.applications.get(handle_by=dept)
@@ -47,12 +106,22 @@ def applicant_writing_task(request, pk, format=None):
     
 @api_view(["PUT", "DELETE"])
 def file_detail(request, pk, format=None):
+    upload = None
+    if request.method == "PUT":
+        # turn oversized bodies away before reading them, then check the file while it streams in
+        if body_too_large(request):
+            return Response("File size too large", status=status.HTTP_400_BAD_REQUEST)
+        upload = PDFUploadHandler(request._request)
+        request._request.upload_handlers = [upload]
+
     try:
         applicant = Applicant.objects.get(pk=pk)
     except Applicant.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
     
     dept = request.data.get("handle_by")
+    if upload is not None and upload.error:
+        return Response(upload.error, status=status.HTTP_400_BAD_REQUEST)
     try:
         application = applicant.applications.get(handle_by=dept)
     except ApplicationStatus.DoesNotExist:
@@ -63,20 +132,110 @@ def file_detail(request, pk, format=None):
     
     if request.method == "PUT":
         serializer = WritingTaskStatusSerializer(application, data=request.data)
-        if request.data.get("writing_task_file").size > 1024 * 1024 * 10:
-            return Response("File size too large", status=status.HTTP_400_BAD_REQUEST)
-        elif request.data.get("writing_task_file").content_type != "application/pdf":
-            return Response("File type not supported", status=status.HTTP_400_BAD_REQUEST)
+        # size and PDF signature were checked by PDFUploadHandler while the file streamed in
+        file = request.data.get("writing_task_file")
+        if file is None:
+            return Response("No file uploaded", status=status.HTTP_400_BAD_REQUEST)
         
         if serializer.is_valid():
-            serializer.save()
-            application.status = "WRTIING_TASK_SUBMITTED"
-            application.save()
+            save_writing_task_file(serializer, application, file)
             return Response(request.data.get("writing_task_file").name, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     elif request.method == "DELETE":
-        application.writing_task_file.delete()
-        application.status = "WRTIING_TASK_EMAIL_SENT"
+        delete_writing_task_file(application)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# Resumable uploads: create a session, PUT the file in chunks at the offset the
+# server reports, then finalize. A failed chunk only costs that chunk.
+@api_view(["POST"])
+def upload_session_create(request, pk, format=None):
+    serializer = CreateUploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        application = ApplicationStatus.objects.get(applicant_id=pk, handle_by=serializer.validated_data.pop("handle_by"))
+    except ApplicationStatus.DoesNotExist:
+        return Response("Can not find corresponding application", status=status.HTTP_400_BAD_REQUEST)
+    if (application.writing_task_ddl < timezone.now()):
+        return Response("Writing task deadline has passed", status=status.HTTP_400_BAD_REQUEST)
+    serializer.save(application=application)
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["GET", "PUT"])
+def upload_session_detail(request, pk, format=None):
+    try:
+        session = UploadSession.objects.select_related("application").get(pk=pk, state="OPEN")
+    except UploadSession.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == "GET":
+        return Response({"offset": session.received, "size": session.size})
+
+    # PUT: the raw request body is the chunk, written at the Upload-Offset header
+    try:
+        offset = int(request.META["HTTP_UPLOAD_OFFSET"])
+    except (KeyError, ValueError):
+        return Response("Upload-Offset header required", status=status.HTTP_400_BAD_REQUEST)
+    if offset != session.received:
+        return Response({"offset": session.received}, status=status.HTTP_409_CONFLICT)
+    if (session.application.writing_task_ddl < timezone.now()):
+        return Response("Writing task deadline has passed", status=status.HTTP_400_BAD_REQUEST)
+    if offset + int(request.META.get("CONTENT_LENGTH") or 0) > session.size:
+        return Response("File size too large", status=status.HTTP_400_BAD_REQUEST)
+
+    end = offset
+    fd = os.open(session.part_path, os.O_WRONLY | os.O_CREAT, 0o600)
+    with os.fdopen(fd, "wb") as part:
+        part.seek(offset)
+        while True:
+            chunk = request.stream.read(CHUNK_SIZE) if request.stream else b""
+            if not chunk:
+                break
+            if end == 0 and PDF_MAGIC not in chunk[:1024]:
+                return Response("File type not supported", status=status.HTTP_400_BAD_REQUEST)
+            if end + len(chunk) > session.size:
+                return Response("File size too large", status=status.HTTP_400_BAD_REQUEST)
+            part.write(chunk)
+            end += len(chunk)
+
+    # compare-and-swap, so of two clients sending the same chunk only one moves the offset
+    if not UploadSession.objects.filter(pk=pk, state="OPEN", received=offset).update(received=end, modified_at=timezone.now()):
+        return Response({"offset": UploadSession.objects.get(pk=pk).received}, status=status.HTTP_409_CONFLICT)
+    return Response({"offset": end, "size": session.size})
+
+
+@api_view(["POST"])
+def upload_session_finalize(request, pk, format=None):
+    with transaction.atomic():
+        try:
+            session = UploadSession.objects.select_for_update()\
+                .select_related("application__applicant").get(pk=pk, state="OPEN")
+        except UploadSession.DoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if session.received != session.size:
+            return Response({"offset": session.received}, status=status.HTTP_409_CONFLICT)
+        application = session.application
+        if (application.writing_task_ddl < timezone.now()):
+            return Response("Writing task deadline has passed", status=status.HTTP_400_BAD_REQUEST)
+
+        # chunks that were cut off may have left bytes past the accepted end
+        os.truncate(session.part_path, session.size)
+        application.writing_task_sha256 = file_sha256(session.part_path)
+        file = AssembledFile(session.part_path, session.file_name)
+        file.sha256 = application.writing_task_sha256
+        previous = application.writing_task_file.name
+        try:
+            application.writing_task_file.save(session.file_name, file, save=False)
+        finally:
+            file.close()
+        release_file(previous, application.writing_task_file.storage)
+        # only left behind when the same content was already stored
+        session.delete_part()
+        application.status = "WRTIING_TASK_SUBMITTED"
         application.save()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        session.state = "COMPLETED"
+        session.save()
+    metrics.histogram("writing_task_upload_bytes", buckets=metrics.SIZE_BUCKETS, mode="resumable").observe(session.size)
+    return Response(application.writing_task_file.name, status=status.HTTP_201_CREATED)
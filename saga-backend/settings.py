@@ -79,6 +79,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.profiling.ProfilingMiddleware',
+    'backend.monitoring.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -164,4 +166,139 @@ MEDIA_URL = '/media/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Outbound email (see backend/email.py)
+
+EMAIL_SMTP_HOST = "smtp.feishu.cn"
+EMAIL_SMTP_PORT = 587
+EMAIL_SMTP_STARTTLS = True
+
+# One connection pool per sender account, shared by all send_* helpers
+EMAIL_SMTP_POOL = {
+    "ENABLED": True,
+    "MAX_SIZE": 4,          # open connections per sender
+    "IDLE_TIMEOUT": 60,     # seconds before an idle connection is closed
+    "CHECK_INTERVAL": 10,   # seconds idle before a NOOP health check on reuse
+    "MAX_MESSAGES": 100,    # messages per connection before it is recycled
+    "TIMEOUT": 30,
+}
+
+# Concurrent senders used by drain_email_outbox, which sends the emails the admin
+# bulk actions queue; keep it at or below EMAIL_SMTP_POOL["MAX_SIZE"] so every
+# sender has a connection
+EMAIL_SEND_CONCURRENCY = 4
+
+# Sending quota per Feishu account, as a token bucket: RATE messages per second
+# on average with bursts of up to BURST. Senders wait for a token instead of
+# being throttled by the server. "local" shares the buckets between the threads
+# of one process, "database" between every process using the database.
+# The admin only queues bulk emails, so these limits pace drain_email_outbox:
+# after the burst, a batch of 500 invitations from one sender takes about
+# 500 / RATE seconds (8 minutes at 1 per second) to go out.
+EMAIL_RATE_LIMIT_BACKEND = "database"
+EMAIL_RATE_LIMITS = {
+    "no-reply@saga-xingguang.com": {"RATE": 1.0, "BURST": 10},
+    "support@saga-xingguang.com": {"RATE": 1.0, "BURST": 10},
+    "human-resource@saga-xingguang.com": {"RATE": 1.0, "BURST": 10},
+}
+
+# Transient SMTP failures (4xx replies, dropped connections) are retried with
+# exponential backoff and full jitter; emails that still fail are recorded in
+# the FailedEmail table and can be re-sent from the admin
+EMAIL_RETRY = {
+    "MAX_ATTEMPTS": 3,
+    "BASE_DELAY": 1.0,      # seconds, doubled on every attempt
+    "MAX_DELAY": 30.0,
+}
+
+# Email templates are shrunk on first use (unused CSS rules dropped, CSS and
+# whitespace minified) and sent with a text/plain alternative; the
+# email_template_stats command reports the savings
+EMAIL_TEMPLATE_OPTIMIZE = True
+
+# Every send writes a row to EmailSendLog with the time spent in each stage
+# (render, rate limit, connect, STARTTLS, AUTH, DATA; the async sender times DNS
+# separately from connect); the email_metrics command summarises them
+EMAIL_SEND_LOG = True
+
+# Seconds a writing-task page stays in the cache; saves invalidate it at once.
+# With the default local-memory cache each worker has its own copy, so every
+# hit is checked against the rows' modified_at (one indexed query) and changes
+# saved by other workers are served at once. With a shared cache (Redis,
+# Memcached) invalidations reach every worker and hits need no query.
+WRITING_TASK_CACHE_TIMEOUT = 60
+
+# Serve the applicant API with the async views in backend/async_views.py. Turn
+# it on when running under asgi.py (uvicorn, daphne); under wsgi.py keep it off,
+# as async views would then need an event loop per request. bench_asgi compares
+# the two setups.
+ASYNC_VIEWS = False
+
+# Token buckets for POST /api/v1/applicants/ (see backend/throttling.py): RATE
+# requests per second with bursts of up to BURST, per client IP and per email
+# address. The IP limit is loose because a campus network shares a few
+# addresses. Throttled clients get a 429 with Retry-After. "local" keeps the
+# buckets per worker process, "database" shares them at the cost of a write per
+# request.
+APPLICANT_THROTTLE_BACKEND = "local"
+APPLICANT_THROTTLES = {
+    "applicant-ip": {"RATE": 1.0, "BURST": 30},
+    "applicant-email": {"RATE": 1 / 60, "BURST": 3},
+}
+
+# nginx passes the client address to uwsgi as REMOTE_ADDR (see uwsgi_params),
+# so X-Forwarded-For only ever holds what the client sent. NUM_PROXIES = 0 makes
+# DRF's throttles key on REMOTE_ADDR and ignore that header; raise it if
+# another proxy is ever put in front of nginx.
+REST_FRAMEWORK = {
+    "NUM_PROXIES": 0,
+}
+
+# Requests allowed inside a view at once, per worker process. Beyond LIMIT a
+# request waits up to WAIT seconds for a slot, then gets a 503 with a
+# Retry-After of RETRY_AFTER seconds. Keep LIMIT below the worker's threads so
+# the admin and the other views always have some left.
+CONCURRENCY_LIMITS = {
+    "applicant_create": {"LIMIT": 8, "WAIT": 2.0, "RETRY_AFTER": 5},
+}
+
+# Per-request profiling (see backend/profiling.py), off unless ENABLED. Logs
+# requests that run more than MAX_QUERIES queries, repeat the same query more
+# than MAX_DUPLICATES times (a lookup per row) or take longer than MAX_MS.
+# BUDGETS overrides these per view name. One request in SAMPLE_EVERY is run
+# under cProfile (0 for never). RAISE turns budget overruns into errors, for
+# tests.
+REQUEST_PROFILING = {
+    "ENABLED": False,
+    "MAX_QUERIES": 20,
+    "MAX_DUPLICATES": 5,
+    "MAX_MS": 500,
+    "SAMPLE_EVERY": 0,
+    "RAISE": False,
+    "BUDGETS": {
+        "backend.views.applicant_writing_task": {"MAX_QUERIES": 1},
+        "backend.views.applicant_create": {"MAX_QUERIES": 5},
+    },
+}
+
+# Prometheus metrics at /metrics (see backend/monitoring.py), only for
+# ALLOWED_IPS. They are kept in the memory of each worker process: run uwsgi
+# with one process and several threads, or scrape every worker on its own
+# socket. The per-status application counts come from one grouped query,
+# cached for STATUS_COUNTS_TTL seconds.
+METRICS = {
+    "ENABLED": True,
+    "ALLOWED_IPS": ["127.0.0.1"],
+    "STATUS_COUNTS_TTL": 30,
+}
+
+# Writing-task files are opened from the admin through signed links that stay
+# valid for MEDIA_SIGNED_URL_MAX_AGE seconds (see backend/media.py). When
+# MEDIA_ACCEL_REDIRECT is set, nginx sends the file itself. This needs an
+# internal location pointing at MEDIA_ROOT, and /media/ itself should not be
+# public:
+#     location /protected-media/ { internal; alias /path/to/saga-backend/media/; }
+# Without it, Django streams the file and supports Range requests.
+MEDIA_SIGNED_URL_MAX_AGE = 3600
+MEDIA_ACCEL_REDIRECT = None  # e.g. "/protected-media/"
@@ -19,8 +19,14 @@ from django.urls import path
 
 from django.conf.urls import include
 
+from backend import media
+from backend.monitoring import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
+    path('media-files/application/<int:pk>', media.writing_task_file, name="writing-task-file"),
+    path('media-files/<str:token>', media.media_file, name="media-file"),
 ]
 
 urlpatterns += [